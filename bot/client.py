@@ -8,23 +8,76 @@ from discord import app_commands
 from discord.ext import commands, tasks
 import logging
 import asyncio
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+import functools
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional, List, Set, Tuple, Deque, AsyncIterator, Awaitable, Callable, TypeVar
 import os
 import re
+import time
 
-# Fix imports by using the "sys.path" approach
-import sys
-import os
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-
-# Now import from core directly
 from core.llm import LLMEngine
-from core.context import ContextManager
+from core.context import ContextManager, UserContext
+from bot.throttling import ChannelRateLimiter, AIMDLimiter
+from bot.commands import setup_commands
 
 # Set up logger for this module
 logger = logging.getLogger("TradeMaster.Client")
 
+# Discord message limit (characters)
+DISCORD_MESSAGE_LIMIT = 2000
+
+# Separators used when splitting long responses into Discord-sized parts
+_PARAGRAPH_SEP = "\n\n"
+_PARAGRAPH_SEP_LEN = len(_PARAGRAPH_SEP)
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+
+T = TypeVar("T")
+
+# Messages up to this many characters use the short-message LLM pool
+SHORT_MESSAGE_LENGTH = 40
+
+# Seconds a response may take before the typing indicator is shown
+TYPING_DELAY = 0.8
+
+# Characters a streamed response needs, unless it already has a complete
+# sentence, before its reply is posted
+STREAM_OPENING_LENGTH = 100
+
+# Minimum seconds between edits of a reply while its response streams in;
+# edits count against the channel's send rate limit
+STREAM_EDIT_INTERVAL = 1.5
+
+# Default location of the user context database
+DEFAULT_CONTEXT_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "contexts.db"
+)
+
+# Prefix for traditional text commands
+COMMAND_PREFIX = "!"
+
+# Guild messages shorter than this that don't mention the bot are ignored unless
+# they contain one of the trigger keywords
+MIN_MESSAGE_LENGTH = 8
+TRIGGER_KEYWORDS = frozenset({
+    "price", "stock", "crypto", "market", "trade", "buy", "sell", "chart",
+    "btc", "eth", "bull", "bear", "gain", "loss", "invest",
+})
+
+# All trigger keywords in one case-insensitive pattern, so a message is
+# scanned once instead of once per keyword
+_TRIGGER_RE = re.compile("|".join(map(re.escape, sorted(TRIGGER_KEYWORDS))), re.IGNORECASE)
+
+# Messages shorter than this never warrant a response unless they mention the bot
+MIN_CONTENT_LENGTH = 3
+
+# Bare links (up to URL_ONLY_MAX_LENGTH characters) and messages made of nothing
+# but emoji are ignored unless they mention the bot
+URL_ONLY_MAX_LENGTH = 80
+_URL_ONLY_RE = re.compile(r'https?://\S+')
+_EMOJI_ONLY_RE = re.compile(
+    r'(?:<a?:\w+:\d+>|[\U0001F000-\U0001FAFF\u2600-\u27BF\uFE0F\u200D]|\s)+'
+)
+
 class TradeMasterClient(commands.Bot):
     """Main Discord bot client for TradeMaster."""
     
@@ -36,175 +89,637 @@ class TradeMasterClient(commands.Bot):
         
         # Initialize bot with command prefix
         super().__init__(
-            command_prefix="!",  # Traditional prefix for fallback
+            command_prefix=COMMAND_PREFIX,  # Traditional prefix for fallback
             intents=intents,
             help_command=None  # Disable default help command
         )
         
-        # Initialize components
-        self.context_manager = ContextManager()
-        self.llm_engine = LLMEngine()
+        # The prefix is static, so keep it as a plain string for the per-message
+        # check instead of going through command_prefix (which may be callable)
+        self._prefix_str = COMMAND_PREFIX
+        
+        # Initialize components. The LLM engine is built in setup_hook since
+        # loading its tools is slow
+        self.context_manager = ContextManager(
+            db_path=os.getenv("CONTEXT_DB_PATH", DEFAULT_CONTEXT_DB_PATH) or None
+        )
+        self.llm_engine: Optional[LLMEngine] = None
+        
+        # Per-channel limiter for outbound messages (5 sends per 5 seconds)
+        self.send_limiter = ChannelRateLimiter(max_sends=5, period=5.0)
+        
+        # Message handlers currently generating a response; close() waits up to
+        # shutdown_timeout seconds for them before disconnecting
+        self._inflight: Set[asyncio.Task] = set()
+        self._closing = False
+        self.shutdown_timeout = 30
+        
+        # Presence shown while connected; reused on every reconnect
+        self._default_activity = discord.Activity(
+            type=discord.ActivityType.watching,
+            name="markets | /help"
+        )
+        
+        # Per-user locks serializing each user's responses, kept in
+        # least-recently-used order and bounded like the contexts themselves
+        self._user_locks: "OrderedDict[int, asyncio.Lock]" = OrderedDict()
+        self._user_lock_capacity = 10_000
+        
+        # Messages waiting for their user's lock; beyond max_pending_per_user
+        # the oldest waiting message is dropped in favor of the newest
+        self._waiting: Dict[int, Deque[asyncio.Task]] = {}
+        self.max_pending_per_user = 4
+        
+        # Guild channels the bot answers unprompted messages in; if unset, all
+        # channels are watched and mentions are answered everywhere
+        self.watch_channel_ids = frozenset(
+            int(channel_id)
+            for channel_id in os.getenv("WATCH_CHANNEL_IDS", "").split(",")
+            if channel_id.strip()
+        )
+        
+        # Adaptive cap on concurrent LLM calls so bursts don't overload the
+        # backend; TM_LLM_CONCURRENCY sets the most calls it will allow at once
+        llm_concurrency = max(1, int(os.getenv("TM_LLM_CONCURRENCY", "8")))
+        self.llm_limiter = AIMDLimiter(
+            initial_limit=min(2, llm_concurrency),
+            max_limit=llm_concurrency,
+            target_latency=5.0
+        )
         
-        # Discord message limit (characters)
-        self.discord_message_limit = 2000
+        # Small fixed pool for short messages, so quick questions aren't stuck
+        # behind long generations
+        self.short_llm_limiter = AIMDLimiter(initial_limit=2, min_limit=2, max_limit=2)
         
         logger.info("TradeMaster client initialized")
     
     async def setup_hook(self):
-        """Register slash commands when the bot is being set up."""
+        """Load the LLM engine and register slash commands when the bot is being set up."""
+        # Build the LLM engine (which imports and initializes all tools) on a
+        # worker thread so the event loop stays responsive, and have it ready
+        # before the gateway connects and the first message arrives
+        self.llm_engine = await asyncio.to_thread(LLMEngine)
+        
         # Load commands from bot/commands.py
-        from bot.commands import setup_commands
         await setup_commands(self)
         
-        # Sync commands with Discord
-        await self.tree.sync()
-        logger.info("Slash commands synchronized")
+        # Sync commands with Discord exactly once. During development, syncing
+        # to a single guild applies instantly and avoids the global sync limits
+        dev_guild_id = os.getenv("DEV_GUILD_ID")
+        if dev_guild_id:
+            guild = discord.Object(id=int(dev_guild_id))
+            self.tree.copy_global_to(guild=guild)
+            await self.tree.sync(guild=guild)
+            logger.info("Slash commands synchronized to development guild %s", dev_guild_id)
+        else:
+            await self.tree.sync()
+            logger.info("Slash commands synchronized")
+        
+        # Start writing changed contexts behind the message handlers
+        self.flush_contexts.start()
     
     async def on_ready(self):
         """Handle the bot's connection to Discord."""
-        logger.info(f"Bot connected as {self.user}")
-        logger.info(f"Connected to {len(self.guilds)} servers")
+        logger.info("Bot connected as %s", self.user)
+        logger.info("Connected to %d servers", len(self.guilds))
         
         # Set presence (status)
-        activity = discord.Activity(
-            type=discord.ActivityType.watching,
-            name="markets | /help"
-        )
-        await self.change_presence(activity=activity)
+        await self.change_presence(activity=self._default_activity)
         
-        # Start background tasks
-        self.cleanup_contexts.start()
+        # Start background tasks; on_ready fires again after reconnects
+        if not self.cleanup_contexts.is_running():
+            self.cleanup_contexts.start()
     
-    def _split_message(self, message: str) -> List[str]:
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _split_message(message: str) -> Tuple[str, ...]:
         """
         Split a long message into multiple messages that fit within Discord's character limit.
         
+        The result only depends on the message, so it is cached; the LLM often
+        repeats the same boilerplate and error responses.
+        
         Args:
             message: The message to split
             
         Returns:
-            A list of message parts
+            A tuple of message parts
         """
+        # Bind the limit locally; it is checked for every paragraph and sentence
+        limit = DISCORD_MESSAGE_LIMIT
+        
         # If message is already within the limit, return it as is
-        if len(message) <= self.discord_message_limit:
-            return [message]
+        if len(message) <= limit:
+            return (message,)
         
         # Split message into parts
         parts = []
         
+        # Pieces of the part being built and their combined length (separators
+        # included); pieces are only joined when a part is flushed
+        current_chunks: List[str] = []
+        current_len = 0
+        
         # Try to split by paragraphs first
-        paragraphs = message.split('\n\n')
-        current_part = ""
+        paragraphs = message.split(_PARAGRAPH_SEP)
         
         for paragraph in paragraphs:
             # If adding this paragraph would exceed the limit, start a new part
-            if len(current_part) + len(paragraph) + 2 > self.discord_message_limit:
-                # If current_part is not empty, add it to parts
-                if current_part:
-                    parts.append(current_part)
+            if current_len + len(paragraph) + _PARAGRAPH_SEP_LEN > limit:
+                # If current part is not empty, add it to parts
+                if current_len:
+                    parts.append("".join(current_chunks))
+                current_chunks = []
+                current_len = 0
                 
                 # Check if paragraph itself is too long
-                if len(paragraph) > self.discord_message_limit:
+                if len(paragraph) > limit:
                     # Split paragraph by sentences
-                    sentences = re.split(r'(?<=[.!?])\s+', paragraph)
-                    current_part = ""
+                    sentences = _SENTENCE_SPLIT_RE.split(paragraph)
                     
                     for sentence in sentences:
-                        if len(current_part) + len(sentence) + 1 > self.discord_message_limit:
-                            parts.append(current_part)
-                            current_part = sentence
+                        if current_len + len(sentence) + 1 > limit:
+                            if current_len:
+                                parts.append("".join(current_chunks))
+                            current_chunks = [sentence]
+                            current_len = len(sentence)
+                        elif current_len:
+                            current_chunks.append(" ")
+                            current_chunks.append(sentence)
+                            current_len += 1 + len(sentence)
                         else:
-                            if current_part:
-                                current_part += " " + sentence
-                            else:
-                                current_part = sentence
+                            current_chunks.append(sentence)
+                            current_len = len(sentence)
                 else:
-                    current_part = paragraph
+                    current_chunks.append(paragraph)
+                    current_len = len(paragraph)
             else:
                 # Add paragraph to current part
-                if current_part:
-                    current_part += "\n\n" + paragraph
-                else:
-                    current_part = paragraph
+                if current_len:
+                    current_chunks.append(_PARAGRAPH_SEP)
+                    current_len += _PARAGRAPH_SEP_LEN
+                current_chunks.append(paragraph)
+                current_len += len(paragraph)
         
         # Add the last part if it's not empty
-        if current_part:
-            parts.append(current_part)
+        if current_len:
+            parts.append("".join(current_chunks))
+        
+        return tuple(parts)
+    
+    async def _throttled_send(self, channel, send: Callable[[], Awaitable[T]]) -> T:
+        """
+        Send a message to a channel once its rate limit allows it.
+        
+        If Discord still reports a rate limit, the channel is blocked for the
+        advertised retry period and the send is attempted once more.
         
-        return parts
+        Args:
+            channel: The channel the message is sent to
+            send: Callable creating the send coroutine
+            
+        Returns:
+            The result of the send
+        """
+        await self.send_limiter.acquire(channel.id)
+        try:
+            return await send()
+        except discord.RateLimited as e:
+            logger.warning("Rate limited in channel %s, retrying in %.2fs", channel.id, e.retry_after)
+            self.send_limiter.penalize(channel.id, e.retry_after)
+            await self.send_limiter.acquire(channel.id)
+            return await send()
     
     async def on_message(self, message):
         """Handle incoming messages."""
-        # Log all incoming messages for debugging
-        logger.debug(f"Received message: {message.content[:50]}... from {message.author.name} in {message.channel.name}")
+        # Resolve the message attributes used throughout the handler once
+        author = message.author
+        channel = message.channel
+        content = message.content
+        
+        # Log all incoming messages for debugging. The check skips even the
+        # argument lookups when debug logging is off; the channel object is
+        # passed as is because DM channels have no name
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Received message: %.50s... from %s in %s", content, author.name, channel)
         
-        # Ignore own messages
-        if message.author == self.user:
+        # Ignore own messages and messages from other bots before doing any work
+        if author == self.user:
             logger.debug("Ignoring own message")
             return
+            
+        if author.bot:
+            logger.debug("Ignoring message from another bot")
+            return
         
-        # Process commands with the command prefix
-        await self.process_commands(message)
+        # Don't start new work while shutting down
+        if self._closing:
+            return
         
-        # Ignore messages with a prefix or from bots
-        if message.content.startswith(self.command_prefix):
-            logger.debug(f"Ignoring message with prefix: {self.command_prefix}")
+        # Only prefixed messages can be commands; they never reach the LLM
+        if content.startswith(self._prefix_str):
+            logger.debug("Processing message with prefix: %s", self._prefix_str)
+            await self.process_commands(message)
             return
-            
-        if message.author.bot:
-            logger.debug("Ignoring message from another bot")
+        
+        # Check if the bot is mentioned, counting replies to its own messages
+        bot_mentioned = self._mentions_bot(message)
+        
+        # Skip trivially ignorable messages before paying for an LLM call
+        if not self._worth_answering(message, content, bot_mentioned):
+            logger.debug("Ignoring message that doesn't warrant a response")
             return
         
-        # Update user context
-        user_id = str(message.author.id)
-        channel_id = str(message.channel.id)
-        self.context_manager.update_last_message(user_id, message.content)
+        # Record the user's activity and channel right away. Snowflake IDs are
+        # used as ints throughout
+        user_id = author.id
+        self.context_manager.touch(user_id, channel_id=channel.id)
         
-        # Add channel ID to context
-        user_context = self.context_manager.get_context(user_id)
-        user_context['channel_id'] = channel_id
+        # Start fetching tool data right away; it doesn't depend on the
+        # conversation, so it overlaps with any response still being
+        # generated for this user
+        prefetch = asyncio.ensure_future(self.llm_engine.fetch_tool_data(content))
         
+        # Track the handler so shutdown can wait for the response to be sent
+        task = asyncio.current_task()
+        self._inflight.add(task)
+        self._enqueue(user_id, task)
         try:
-            # Check if the bot is mentioned (for logging purposes only)
-            bot_mentioned = self.user.mentioned_in(message)
-            
-            # Direct all messages to the LLM engine without gatekeeper filtering
-            async with message.channel.typing():
-                # Generate response using LLM engine
-                response = await self.llm_engine.generate_response(
-                    message.content,
-                    user_id,
-                    context=user_context
-                )
-                
-                # Update context with bot's response
-                self.context_manager.add_bot_response(user_id, response)
+            # One response at a time per user; different users run concurrently
+            async with self._user_lock(user_id):
+                self._dequeue(user_id, task)
                 
-                # Split response if it's too long
+                # The message joins the history only once it is this user's
+                # turn, so it lands after the previous message's response and
+                # messages dropped while waiting never enter it
+                user_context = self.context_manager.update_last_message(user_id, content)
+                await self._respond(message, user_id, user_context, bot_mentioned, prefetch)
+        finally:
+            self._dequeue(user_id, task)
+            self._inflight.discard(task)
+            prefetch.cancel()
+    
+    def _enqueue(self, user_id: int, task: asyncio.Task):
+        """
+        Register a message handler as waiting for its user's lock.
+        
+        If the user already has max_pending_per_user messages waiting, the
+        oldest of them is cancelled.
+        
+        Args:
+            user_id: The user's ID
+            task: The message handler task
+        """
+        waiting = self._waiting.get(user_id)
+        if waiting is None:
+            waiting = self._waiting[user_id] = deque()
+        
+        if len(waiting) >= self.max_pending_per_user:
+            logger.info("Dropping oldest pending message from user %s", user_id)
+            waiting.popleft().cancel()
+        
+        waiting.append(task)
+    
+    def _dequeue(self, user_id: int, task: asyncio.Task):
+        """
+        Remove a message handler from its user's waiting messages, if present.
+        
+        Args:
+            user_id: The user's ID
+            task: The message handler task
+        """
+        waiting = self._waiting.get(user_id)
+        if waiting is None or task not in waiting:
+            return
+        
+        waiting.remove(task)
+        if not waiting:
+            del self._waiting[user_id]
+    
+    def _user_lock(self, user_id: int) -> asyncio.Lock:
+        """
+        Get the lock serializing responses to a user, creating it if needed.
+        
+        Least recently used locks are dropped beyond the capacity, as long as
+        nobody holds them.
+        
+        Args:
+            user_id: The user's ID
+            
+        Returns:
+            The user's lock
+        """
+        locks = self._user_locks
+        lock = locks.get(user_id)
+        
+        if lock is not None:
+            locks.move_to_end(user_id)
+            return lock
+        
+        lock = locks[user_id] = asyncio.Lock()
+        while len(locks) > self._user_lock_capacity:
+            oldest = next(iter(locks.values()))
+            if oldest.locked():
+                break
+            locks.popitem(last=False)
+        
+        return lock
+    
+    def _mentions_bot(self, message) -> bool:
+        """
+        Check whether a message is addressed to the bot.
+        
+        Explicit mentions count, and so do replies to one of the bot's own
+        messages, whether or not the reply pings. The raw mention IDs come
+        straight from the gateway payload, so this avoids resolving Member
+        objects just to test membership.
+        
+        Args:
+            message: The Discord message
+            
+        Returns:
+            True if the message mentions or replies to the bot
+        """
+        if self.user.id in message.raw_mentions:
+            return True
+        
+        # The referenced message is resolved from the gateway payload; a
+        # deleted or unfetched one has no author and doesn't count
+        reference = message.reference
+        if reference is None:
+            return False
+        
+        author = getattr(reference.resolved, "author", None)
+        return author is not None and author.id == self.user.id
+    
+    def _worth_answering(self, message, content: str, bot_mentioned: bool) -> bool:
+        """
+        Cheaply decide whether a message may warrant a response.
+        
+        Mentions always pass. Otherwise, near-empty messages (including
+        attachment-only ones), bare links, emoji-only messages and messages
+        without a single letter are skipped, as are guild messages outside
+        the watched channels. Direct messages and guild messages of at least
+        MIN_MESSAGE_LENGTH characters then pass; shorter guild messages only
+        pass if they contain a trigger keyword.
+        
+        Args:
+            message: The Discord message
+            content: The message content
+            bot_mentioned: Whether the message mentions the bot
+            
+        Returns:
+            True if the message should be passed on to the LLM engine
+        """
+        if bot_mentioned:
+            return True
+        
+        stripped = content.strip()
+        if len(stripped) < MIN_CONTENT_LENGTH:
+            return False
+        
+        if len(stripped) <= URL_ONLY_MAX_LENGTH and _URL_ONLY_RE.fullmatch(stripped):
+            return False
+        
+        if _EMOJI_ONLY_RE.fullmatch(stripped):
+            return False
+        
+        if not any(c.isalpha() for c in stripped):
+            return False
+        
+        if message.guild is None:
+            return True
+        
+        if self.watch_channel_ids and message.channel.id not in self.watch_channel_ids:
+            return False
+        
+        if len(content) >= MIN_MESSAGE_LENGTH:
+            return True
+        
+        return _TRIGGER_RE.search(content) is not None
+    
+    async def _generate(self, content: str, user_id: int, user_context: UserContext,
+                        prefetch: "asyncio.Future[Any]") -> AsyncIterator[str]:
+        """
+        Generate a response to a message with the LLM engine.
+        
+        Args:
+            content: The message content
+            user_id: The author's ID as used by the context manager
+            user_context: The author's context
+            prefetch: Future resolving to the message's tool data
+            
+        Yields:
+            The pieces of the response text as they arrive
+        """
+        # Wait for the tool data outside the LLM slot so tool latency doesn't
+        # count against the LLM's concurrency limit
+        tool_data = await prefetch
+        
+        limiter = self.short_llm_limiter if len(content) <= SHORT_MESSAGE_LENGTH else self.llm_limiter
+        
+        # The engine holds the slot around the Groq API call only, so failed
+        # calls count against the limit even though a fallback is sent. The
+        # stream is read in its own task so the slot doesn't also cover the
+        # time the caller spends sending each piece to Discord. None marks the
+        # end of the stream
+        parts: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+        
+        async def read():
+            try:
+                async for part in self.llm_engine.stream_response(
+                    content,
+                    user_id,
+                    context=user_context,
+                    tool_data=tool_data,
+                    slot=limiter.slot
+                ):
+                    parts.put_nowait(part)
+            finally:
+                parts.put_nowait(None)
+        
+        reader = asyncio.ensure_future(read())
+        try:
+            while True:
+                part = await parts.get()
+                if part is None:
+                    break
+                yield part
+            
+            # Raise the stream's error, if any
+            await reader
+        finally:
+            reader.cancel()
+    
+    @staticmethod
+    async def _read_opening(stream: AsyncIterator[str]) -> Tuple[str, bool]:
+        """
+        Read a response stream until it has enough text to post.
+        
+        Args:
+            stream: The response stream
+            
+        Returns:
+            The text read so far and whether the stream has ended
+        """
+        text = ""
+        while True:
+            try:
+                text += await stream.__anext__()
+            except StopAsyncIteration:
+                return text, True
+            
+            if len(text) >= STREAM_OPENING_LENGTH or _SENTENCE_SPLIT_RE.search(text):
+                return text, False
+    
+    async def _respond(self, message, user_id: int, user_context: UserContext, bot_mentioned: bool,
+                       prefetch: "asyncio.Future[Any]"):
+        """
+        Generate a response to a message with the LLM engine and send it.
+        
+        Args:
+            message: The Discord message being answered
+            user_id: The author's ID as used by the context manager
+            user_context: The author's context
+            bot_mentioned: Whether the message mentions the bot
+            prefetch: Future resolving to the message's tool data
+        """
+        author = message.author
+        channel = message.channel
+        content = message.content
+        
+        # The reply is posted once the response has an opening worth reading
+        # and edited while the rest streams in
+        reply = None
+        stream = self._generate(content, user_id, user_context, prefetch)
+        try:
+            # Direct all messages to the LLM engine without gatekeeper filtering.
+            # The typing indicator costs a request to Discord, so it is only
+            # shown if the opening hasn't arrived within TYPING_DELAY seconds
+            opening = asyncio.ensure_future(self._read_opening(stream))
+            try:
+                done, _ = await asyncio.wait((opening,), timeout=TYPING_DELAY)
+                if not done:
+                    async with channel.typing():
+                        await opening
+                response, finished = opening.result()
+            finally:
+                # The stream can't be closed while this is still running in it
+                if opening.cancel():
+                    await asyncio.wait((opening,))
+            
+            # Show the response while it is generated, as long as it fits in
+            # one message. Every edit uses one of the channel's sends, so edits
+            # are at least STREAM_EDIT_INTERVAL apart and skipped while other
+            # sends to the channel are waiting
+            shown = ""
+            last_update = 0.0
+            while not finished:
+                if len(response) <= DISCORD_MESSAGE_LIMIT:
+                    text = response
+                    if reply is None:
+                        reply = await self._throttled_send(channel, lambda: message.reply(text))
+                        shown = text
+                        last_update = time.monotonic()
+                    elif (text != shown and time.monotonic() - last_update >= STREAM_EDIT_INTERVAL
+                          and not self.send_limiter.is_busy(channel.id)):
+                        await self._throttled_send(channel, lambda: reply.edit(content=text))
+                        shown = text
+                        last_update = time.monotonic()
+                try:
+                    response += await stream.__anext__()
+                except StopAsyncIteration:
+                    finished = True
+            
+            # Discord rejects empty messages, so there is nothing to send
+            if not response:
+                logger.warning("LLM engine returned an empty response to message from %s", author.name)
+                return
+            
+            # Update context with bot's response
+            self.context_manager.add_bot_response(user_id, response)
+            
+            if len(response) <= DISCORD_MESSAGE_LIMIT:
+                # Most responses fit in one message; reply without splitting
+                message_parts = [response]
+            else:
+                # Split response since it's too long
                 message_parts = self._split_message(response)
-                
-                # Send the first part as a reply
-                await message.reply(message_parts[0])
-                
-                # Send any additional parts as follow-up messages
-                for part in message_parts[1:]:
-                    await message.channel.send(part)
-                
-                logger.info(f"Responded to message from {message.author.name}: {message.content[:50]}... (in {len(message_parts)} parts)")
+            
+            # Send the first part as a reply, or bring the streamed reply up to
+            # date with it
+            if reply is None:
+                await self._throttled_send(channel, lambda: message.reply(message_parts[0]))
+            elif message_parts[0] != shown:
+                await self._throttled_send(channel, lambda: reply.edit(content=message_parts[0]))
+            
+            # Send any additional parts as follow-up messages, one at a time
+            # so they appear in order
+            for part in message_parts[1:]:
+                await self._throttled_send(channel, lambda part=part: channel.send(part))
+            
+            logger.info("Responded to message from %s: %.50s... (in %d parts)",
+                        author.name, content, len(message_parts))
+        
+        except Exception as e:
+            logger.error("Error processing message: %s", e)
+            error_reply = "I encountered an error processing your request. Please try again later."
+            if reply is not None:
+                # Don't leave a truncated response in the channel
+                await self._throttled_send(channel, lambda: reply.edit(content=error_reply))
+            elif bot_mentioned:
+                await self._throttled_send(channel, lambda: message.reply(error_reply))
+        
+        finally:
+            # Release the LLM slot and the API connection if the stream was
+            # abandoned early
+            await stream.aclose()
+    
+    async def close(self):
+        """Let in-flight responses finish and save contexts before disconnecting."""
+        self._closing = True
         
+        # Give responses already being generated a chance to be sent
+        current = asyncio.current_task()
+        pending = [task for task in self._inflight if task is not current]
+        if pending:
+            logger.info("Waiting for %d in-flight responses before shutdown", len(pending))
+            _, not_done = await asyncio.wait(pending, timeout=self.shutdown_timeout)
+            for task in not_done:
+                task.cancel()
+        
+        # Stop background loops and write out any unsaved context changes
+        self.cleanup_contexts.cancel()
+        self.flush_contexts.cancel()
+        try:
+            await self.context_manager.flush()
         except Exception as e:
-            logger.error(f"Error processing message: {e}")
-            if bot_mentioned:
-                await message.reply("I encountered an error processing your request. Please try again later.")
+            logger.error("Error flushing contexts during shutdown: %s", e)
+        self.context_manager.close()
+        
+        # Close the tools' HTTP sessions
+        if self.llm_engine is not None:
+            await self.llm_engine.close()
+        
+        await super().close()
     
-    @tasks.loop(hours=6)
+    @tasks.loop(minutes=5)
     async def cleanup_contexts(self):
         """Periodically clean up expired user contexts."""
         try:
             self.context_manager.clean_expired_contexts()
+            self.send_limiter.prune()
         except Exception as e:
-            logger.error(f"Error cleaning up contexts: {e}")
+            logger.error("Error cleaning up contexts: %s", e)
             
+    @tasks.loop(seconds=5)
+    async def flush_contexts(self):
+        """Periodically persist user contexts changed since the last flush."""
+        try:
+            await self.context_manager.flush()
+        except Exception as e:
+            logger.error("Error flushing contexts: %s", e)
+    
     @cleanup_contexts.before_loop
     async def before_cleanup(self):
         """Wait until the bot is ready before starting the cleanup task."""
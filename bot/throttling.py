@@ -0,0 +1,218 @@
+"""
+Outbound Throttling for TradeMaster 2.0
+
+This module provides the rate limiting helpers the Discord client uses to keep
+its outbound traffic within Discord's limits.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+logger = logging.getLogger("TradeMaster.Throttling")
+
+class _ChannelBucket:
+    """Send timestamps and ordering lock for a single channel."""
+
+    __slots__ = ("timestamps", "lock", "blocked_until")
+
+    def __init__(self):
+        self.timestamps: Deque[float] = deque()
+        self.lock = asyncio.Lock()
+        self.blocked_until = 0.0
+
+class ChannelRateLimiter:
+    """
+    Sliding-window rate limiter for messages sent to Discord channels.
+
+    Each channel has its own bucket, so a busy channel never delays sends to
+    another one. A send beyond the limit waits until the oldest send in the
+    window has expired, and a rate limit reported by Discord blocks the
+    channel for the advertised retry period.
+    """
+
+    def __init__(self, max_sends: int = 5, period: float = 5.0):
+        """
+        Initialize the rate limiter.
+
+        Args:
+            max_sends: Maximum number of sends allowed per channel in one window
+            period: Length of the sliding window in seconds
+        """
+        self.max_sends = max_sends
+        self.period = period
+        self._buckets: Dict[int, _ChannelBucket] = {}
+
+    def _evict(self, bucket: _ChannelBucket, now: float):
+        """Drop timestamps that have left the sliding window."""
+        cutoff = now - self.period
+        while bucket.timestamps and bucket.timestamps[0] <= cutoff:
+            bucket.timestamps.popleft()
+
+    async def acquire(self, channel_id: int):
+        """
+        Wait until a message may be sent to a channel and record the send.
+
+        Args:
+            channel_id: The Discord channel ID
+        """
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = _ChannelBucket()
+
+        async with bucket.lock:
+            now = time.monotonic()
+
+            # Honor any rate limit reported by Discord for this channel
+            if bucket.blocked_until > now:
+                await asyncio.sleep(bucket.blocked_until - now)
+                now = time.monotonic()
+
+            self._evict(bucket, now)
+            if len(bucket.timestamps) >= self.max_sends:
+                delay = bucket.timestamps[0] + self.period - now
+                logger.debug("Throttling channel %s for %.2fs", channel_id, delay)
+                await asyncio.sleep(delay)
+                now = time.monotonic()
+                self._evict(bucket, now)
+
+            bucket.timestamps.append(now)
+
+    def is_busy(self, channel_id: int) -> bool:
+        """
+        Check whether a send to a channel would have to wait.
+
+        Optional sends, such as progress edits, can be skipped while this is
+        true so they don't delay the sends that are already queued.
+
+        Args:
+            channel_id: The Discord channel ID
+
+        Returns:
+            True if other sends are waiting, the channel is blocked, or its
+            window is full
+        """
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            return False
+
+        now = time.monotonic()
+        if bucket.lock.locked() or bucket.blocked_until > now:
+            return True
+
+        self._evict(bucket, now)
+        return len(bucket.timestamps) >= self.max_sends
+
+    def penalize(self, channel_id: int, retry_after: float):
+        """
+        Block a channel after Discord reports that it is being rate limited.
+
+        Args:
+            channel_id: The Discord channel ID
+            retry_after: Seconds Discord asked us to wait before retrying
+        """
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = _ChannelBucket()
+        bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+
+    def prune(self):
+        """Remove buckets for channels with no sends in the current window."""
+        now = time.monotonic()
+        idle = []
+
+        for channel_id, bucket in self._buckets.items():
+            self._evict(bucket, now)
+            if not bucket.timestamps and not bucket.lock.locked() and bucket.blocked_until <= now:
+                idle.append(channel_id)
+
+        for channel_id in idle:
+            del self._buckets[channel_id]
+
+class AIMDLimiter:
+    """
+    Adaptive concurrency limiter using additive-increase/multiplicative-decrease.
+
+    The limiter caps how many calls may run at once. While the average latency
+    of recent calls stays within the target, the limit grows by a fixed step
+    after each call; when latency exceeds the target or a call fails, the
+    limit is multiplied down. This keeps the backend near the concurrency at
+    which it still answers quickly instead of letting bursts pile up on it.
+    """
+
+    def __init__(self, initial_limit: int = 2, min_limit: int = 1, max_limit: int = 8,
+                 target_latency: float = 5.0, window: int = 20,
+                 increase: float = 1.0, decrease: float = 0.5):
+        """
+        Initialize the limiter.
+
+        Args:
+            initial_limit: Number of concurrent calls allowed at start
+            min_limit: Lower bound for the concurrency limit
+            max_limit: Upper bound for the concurrency limit
+            target_latency: Average latency in seconds considered healthy
+            window: Number of recent calls used to compute the average latency
+            increase: Amount added to the limit after a healthy call
+            decrease: Factor applied to the limit after a slow or failed call
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+
+        self._limit = float(max(min_limit, min(max_limit, initial_limit)))
+        self._in_flight = 0
+        self._latencies: Deque[float] = deque(maxlen=window)
+        self._condition = asyncio.Condition()
+
+    @property
+    def limit(self) -> int:
+        """The number of calls currently allowed to run at once."""
+        return max(self.min_limit, int(self._limit))
+
+    def _record(self, latency: float, failed: bool):
+        """Adjust the limit based on the outcome of a finished call."""
+        self._latencies.append(latency)
+        average = sum(self._latencies) / len(self._latencies)
+
+        if failed or average > self.target_latency:
+            self._limit = max(float(self.min_limit), self._limit * self.decrease)
+            logger.debug("Decreased concurrency limit to %d (avg latency %.2fs)", self.limit, average)
+        else:
+            self._limit = min(float(self.max_limit), self._limit + self.increase)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold one concurrency slot for the duration of a call.
+
+        Exceptions raised inside the block count as failures and shrink the
+        limit before being re-raised. A call that is cancelled or abandoned
+        says nothing about the backend, so it frees its slot without being
+        recorded.
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+
+        start = time.monotonic()
+        # None while the call hasn't finished or failed
+        failed: Optional[bool] = None
+        try:
+            yield
+            failed = False
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            async with self._condition:
+                self._in_flight -= 1
+                if failed is not None:
+                    self._record(time.monotonic() - start, failed)
+                self._condition.notify_all()
@@ -5,13 +5,159 @@ This module manages user conversation contexts to maintain continuity
 in conversations and provide more relevant responses.
 """
 
+import asyncio
+import heapq
 import logging
-from typing import Dict, Any, List, Optional, Tuple
+from collections import OrderedDict, deque
+from itertools import islice
+from dataclasses import dataclass, field
+from typing import Dict, Any, Deque, List, Optional, Set, Tuple, Union
 from datetime import datetime, timedelta
-import json
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from utils.serialization import dumpb, loads
+
+__all__ = ['ChatMessage', 'ContextManager', 'UserContext', 'iso']
 
 logger = logging.getLogger("TradeMaster.Context")
 
+# Messages kept in a user's history unless the context manager is configured
+# otherwise; also bounds contexts created outside the context manager
+DEFAULT_MAX_HISTORY = 10
+
+def iso(ts: Optional[float]) -> Optional[str]:
+    """
+    Format a Unix timestamp as a local ISO 8601 string.
+    
+    Timestamps are stored as floats and only formatted when they are shown
+    or exported.
+    
+    Args:
+        ts: The timestamp, or None
+        
+    Returns:
+        The formatted timestamp, or None if no timestamp was given
+    """
+    return None if ts is None else datetime.fromtimestamp(ts).isoformat()
+
+@dataclass(slots=True)
+class ChatMessage:
+    """A single entry in a user's conversation history."""
+    role: str
+    content: str
+    timestamp: float
+
+@dataclass(slots=True)
+class UserContext:
+    """
+    Conversation state kept for a single user.
+    
+    Every user has the same small set of fields, so a slotted dataclass is
+    used instead of a dictionary per user.
+    """
+    last_message: str = ""
+    last_active: Optional[float] = None
+    last_bot_response: str = ""
+    last_interaction_time: Optional[float] = None
+    channel_id: Optional[int] = None
+    message_history: Deque[ChatMessage] = field(default_factory=lambda: deque(maxlen=DEFAULT_MAX_HISTORY))
+    user_info: Dict[str, Any] = field(default_factory=dict)
+    
+    # The same history in the {'role', 'content'} form the LLM API takes, kept
+    # alongside message_history so it isn't rebuilt for every request
+    llm_history: Deque[Dict[str, str]] = field(default_factory=lambda: deque(maxlen=DEFAULT_MAX_HISTORY))
+    
+    # Monotonic time of the last activity, used for expiry; unlike last_active
+    # it isn't affected by wall clock adjustments
+    last_seen: float = 0.0
+    
+    def add_message(self, role: str, content: str, timestamp: float):
+        """
+        Append a message to the history and its LLM-ready counterpart.
+        
+        Args:
+            role: Who sent the message ('user' or 'assistant')
+            content: The message text
+            timestamp: When the message was sent
+        """
+        self.message_history.append(ChatMessage(role, content, timestamp))
+        self.llm_history.append({'role': role, 'content': content})
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Export the context as a JSON-serializable dictionary.
+        
+        Returns:
+            The context with all timestamps formatted as ISO strings
+        """
+        return {
+            'last_message': self.last_message,
+            'last_active': iso(self.last_active),
+            'last_bot_response': self.last_bot_response,
+            'last_interaction_time': iso(self.last_interaction_time),
+            'channel_id': self.channel_id,
+            'message_history': [
+                {'role': msg.role, 'content': msg.content, 'timestamp': iso(msg.timestamp)}
+                for msg in self.message_history
+            ],
+            'user_info': dict(self.user_info),
+        }
+    
+    def to_record(self) -> bytes:
+        """
+        Serialize the context for the backing store.
+        
+        Unlike to_dict, timestamps are kept as floats so they round-trip.
+        
+        Returns:
+            The context as UTF-8 encoded JSON
+        """
+        return dumpb({
+            'last_message': self.last_message,
+            'last_active': self.last_active,
+            'last_bot_response': self.last_bot_response,
+            'last_interaction_time': self.last_interaction_time,
+            'channel_id': self.channel_id,
+            'message_history': [
+                [msg.role, msg.content, msg.timestamp]
+                for msg in self.message_history
+            ],
+            'user_info': self.user_info,
+        })
+    
+    @classmethod
+    def from_record(cls, record: Union[str, bytes], max_history: int) -> "UserContext":
+        """
+        Restore a context serialized with to_record.
+        
+        Args:
+            record: The serialized context
+            max_history: Maximum number of messages kept in the history
+            
+        Returns:
+            The restored context
+        """
+        data = loads(record)
+        context = cls(
+            last_message=data['last_message'],
+            last_active=data['last_active'],
+            last_bot_response=data['last_bot_response'],
+            last_interaction_time=data['last_interaction_time'],
+            channel_id=data['channel_id'],
+            message_history=deque(maxlen=max_history),
+            user_info=data['user_info'],
+            llm_history=deque(maxlen=max_history),
+        )
+        
+        for entry in data['message_history']:
+            context.add_message(*entry)
+        
+        return context
+
 class ContextManager:
     """
     Manages user conversation contexts for TradeMaster.
@@ -20,57 +166,168 @@ class ContextManager:
     including conversation history, user preferences, and interaction patterns.
     """
     
-    def __init__(self, max_history: int = 10, context_expiry: int = 24):
+    def __init__(self, max_history: int = DEFAULT_MAX_HISTORY, context_expiry: int = 24, max_contexts: int = 10_000,
+                 db_path: Optional[str] = None):
         """
         Initialize the context manager.
         
         Args:
             max_history: Maximum number of messages to store in history
             context_expiry: Hours after which context expires
+            max_contexts: Maximum number of user contexts kept in memory
+            db_path: SQLite database contexts are persisted to; if None,
+                contexts are kept in memory only
         """
-        # Dictionary to store user contexts
-        self.contexts: Dict[str, Dict[str, Any]] = {}
+        # User contexts in least-recently-used order; the oldest are evicted
+        # once more than max_contexts users are tracked
+        self.contexts: "OrderedDict[int, UserContext]" = OrderedDict()
         
         # Configuration
         self.max_history = max_history
+        self.max_contexts = max_contexts
         self.context_expiry = timedelta(hours=context_expiry)
+        self._expiry_seconds = self.context_expiry.total_seconds()
+        
+        # Write-behind state: contexts changed since the last flush, and the
+        # IDs of contexts removed since then
+        self._dirty: Set[int] = set()
+        self._removed: Set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        
+        # Contexts evicted from memory with unsaved changes; the next flush
+        # writes them out
+        self._evicted: Dict[int, UserContext] = {}
+        
+        # Optional SQLite backing store; contexts evicted from memory are
+        # loaded back from it when their user returns. Loads go through a
+        # separate read-only connection that doesn't share _db_lock, so they
+        # never wait for a flush running on a worker thread
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_reader: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = self._open_store(db_path)
+            self._db_reader = sqlite3.connect(
+                f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False
+            )
+        
+        # Min-heap of (monotonic expiry time, user ID). Each user has at most
+        # one entry; entries are only checked against last_seen when they come
+        # due, so activity never has to update the heap
+        self._expiry_heap: List[Tuple[float, int]] = []
+        self._scheduled: Set[int] = set()
         
         logger.info("Context Manager initialized")
     
-    def update_last_message(self, user_id: str, message: str):
+    def _open_store(self, db_path: str) -> sqlite3.Connection:
         """
-        Update a user's context with their latest message.
+        Open the SQLite backing store, creating it if needed.
+        
+        Args:
+            db_path: Path of the database file
+            
+        Returns:
+            The database connection
+        """
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        # Writes run on worker threads, serialized by _db_lock. WAL lets the
+        # reader connection proceed during a write, and NORMAL sync only
+        # fsyncs at checkpoints
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS contexts ("
+            "user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, last_active REAL NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS contexts_last_active ON contexts (last_active)")
+        db.commit()
+        
+        logger.info("Persisting user contexts to %s", db_path)
+        return db
+    
+    def _load(self, user_id: int) -> Optional[UserContext]:
+        """
+        Load a user's context from the backing store unless it has expired.
         
         Args:
             user_id: The user's ID
-            message: The user's message
+            
+        Returns:
+            The stored context, or None if there is none
+        """
+        if self._db_reader is None:
+            return None
+        
+        # A primary key lookup on the reader connection; under WAL it sees the
+        # last committed flush without blocking on one in progress
+        cutoff = time.time() - self._expiry_seconds
+        row = self._db_reader.execute(
+            "SELECT data FROM contexts WHERE user_id = ? AND last_active >= ?",
+            (user_id, cutoff)
+        ).fetchone()
+        
+        return None if row is None else UserContext.from_record(row[0], self.max_history)
+    
+    def touch(self, user_id: int, *, channel_id: Optional[int] = None,
+              last_message: Optional[str] = None) -> UserContext:
+        """
+        Record activity for a user and apply several updates in one call.
+        
+        The context is looked up once, its activity time is refreshed, and
+        any provided fields are written before it is returned.
+        
+        Args:
+            user_id: The user's ID
+            channel_id: The channel the user is active in, if known
+            last_message: The user's latest message, added to the history
+            
+        Returns:
+            The user's updated context
         """
         # Get or create user context
         context = self.get_context(user_id)
         
-        # Update last message
-        context['last_message'] = message
-        context['last_active'] = datetime.now().isoformat()
+        # Activity is tracked as a Unix timestamp for display and on the
+        # monotonic clock for expiry
+        now = context.last_active = time.time()
+        seen = context.last_seen = time.monotonic()
         
-        # Update message history
-        if 'message_history' not in context:
-            context['message_history'] = []
+        # Schedule an expiry check unless one is already pending
+        if user_id not in self._scheduled:
+            heapq.heappush(self._expiry_heap, (seen + self._expiry_seconds, user_id))
+            self._scheduled.add(user_id)
         
-        # Add message to history with timestamp
-        context['message_history'].append({
-            'role': 'user',
-            'content': message,
-            'timestamp': datetime.now().isoformat()
-        })
+        if channel_id is not None:
+            context.channel_id = channel_id
         
-        # Trim history if it gets too long
-        if len(context['message_history']) > self.max_history:
-            context['message_history'] = context['message_history'][-self.max_history:]
+        if last_message is not None:
+            context.last_message = last_message
+            
+            # Add message to history with timestamp; the history is bounded,
+            # so the oldest entry drops out once it is full
+            context.add_message('user', last_message, now)
         
-        # Store updated context
-        self.contexts[user_id] = context
+        self._dirty.add(user_id)
+        return context
     
-    def add_bot_response(self, user_id: str, response: str):
+    def update_last_message(self, user_id: int, message: str) -> UserContext:
+        """
+        Update a user's context with their latest message.
+        
+        Args:
+            user_id: The user's ID
+            message: The user's message
+            
+        Returns:
+            The user's updated context
+        """
+        return self.touch(user_id, last_message=message)
+    
+    def add_bot_response(self, user_id: int, response: str):
         """
         Add a bot response to the user's context.
         
@@ -81,18 +338,15 @@ class ContextManager:
         context = self.get_context(user_id)
         
         # Update last bot response
-        context['last_bot_response'] = response
-        context['last_interaction_time'] = datetime.now().isoformat()
+        context.last_bot_response = response
+        now = context.last_interaction_time = time.time()
         
         # Add response to message history
-        if 'message_history' in context:
-            context['message_history'].append({
-                'role': 'assistant', 
-                'content': response,
-                'timestamp': datetime.now().isoformat()
-            })
+        context.add_message('assistant', response, now)
+        
+        self._dirty.add(user_id)
     
-    def get_context(self, user_id: str) -> Dict[str, Any]:
+    def get_context(self, user_id: int) -> UserContext:
         """
         Get a user's context, creating a new one if it doesn't exist.
         
@@ -100,15 +354,41 @@ class ContextManager:
             user_id: The user's ID
             
         Returns:
-            The user's context dictionary
+            The user's context
         """
-        # Create empty context if it doesn't exist
-        if user_id not in self.contexts:
-            self.contexts[user_id] = {}
+        contexts = self.contexts
+        context = contexts.get(user_id)
         
-        return self.contexts[user_id]
+        if context is not None:
+            # Mark as most recently used
+            contexts.move_to_end(user_id)
+            return context
+        
+        # Bring back a context evicted from memory, from the pending writes
+        # or the backing store, or create an empty one
+        context = self._evicted.pop(user_id, None)
+        if context is None and user_id not in self._removed:
+            context = self._load(user_id)
+        if context is None:
+            context = UserContext(
+                message_history=deque(maxlen=self.max_history),
+                llm_history=deque(maxlen=self.max_history)
+            )
+        
+        self._removed.discard(user_id)
+        contexts[user_id] = context
+        
+        # Evict the least recently used contexts beyond the capacity, keeping
+        # unsaved ones until the next flush has written them
+        while len(contexts) > self.max_contexts:
+            evicted_id, evicted = contexts.popitem(last=False)
+            if evicted_id in self._dirty:
+                self._dirty.discard(evicted_id)
+                self._evicted[evicted_id] = evicted
+        
+        return context
     
-    def get_conversation_history(self, user_id: str, 
+    def get_conversation_history(self, user_id: int, 
                                  max_messages: Optional[int] = None) -> List[Dict[str, str]]:
         """
         Get a user's conversation history in a format suitable for LLMs.
@@ -120,47 +400,49 @@ class ContextManager:
         Returns:
             List of message dictionaries with 'role' and 'content'
         """
-        context = self.get_context(user_id)
-        history = context.get('message_history', [])
+        # The LLM-ready history is maintained on append, so only the requested
+        # tail needs to be copied
+        history = self.get_context(user_id).llm_history
         
         # If max_messages specified, trim history
         if max_messages and len(history) > max_messages:
-            history = history[-max_messages:]
-        
-        # Format for LLM (remove timestamps)
-        formatted_history = [
-            {'role': msg['role'], 'content': msg['content']}
-            for msg in history
-        ]
+            return list(islice(history, len(history) - max_messages, None))
         
-        return formatted_history
+        return list(history)
     
     def clean_expired_contexts(self):
         """
         Remove expired user contexts to free up memory.
         """
-        now = datetime.now()
-        expired_users = []
-        
-        for user_id, context in self.contexts.items():
-            last_active = context.get('last_active')
-            if last_active:
-                try:
-                    active_time = datetime.fromisoformat(last_active)
-                    if now - active_time > self.context_expiry:
-                        expired_users.append(user_id)
-                except (ValueError, TypeError):
-                    # If we can't parse the timestamp, consider it expired
-                    expired_users.append(user_id)
+        now = time.monotonic()
+        heap = self._expiry_heap
+        expired = 0
         
-        # Remove expired contexts
-        for user_id in expired_users:
-            del self.contexts[user_id]
+        # Only entries that have come due are looked at
+        while heap and heap[0][0] < now:
+            _, user_id = heapq.heappop(heap)
+            context = self.contexts.get(user_id)
+            
+            if context is None:
+                # Already evicted
+                self._scheduled.discard(user_id)
+                continue
+            
+            expiry = context.last_seen + self._expiry_seconds
+            if expiry < now:
+                del self.contexts[user_id]
+                self._scheduled.discard(user_id)
+                self._dirty.discard(user_id)
+                self._removed.add(user_id)
+                expired += 1
+            else:
+                # Active since the entry was pushed; check again when it expires
+                heapq.heappush(heap, (expiry, user_id))
         
-        if expired_users:
-            logger.info(f"Cleaned {len(expired_users)} expired user contexts")
+        if expired:
+            logger.info("Cleaned %d expired user contexts", expired)
     
-    def update_user_info(self, user_id: str, **kwargs):
+    def update_user_info(self, user_id: int, **kwargs):
         """
         Update user information in the context.
         
@@ -168,15 +450,11 @@ class ContextManager:
             user_id: The user's ID
             **kwargs: Key-value pairs to update
         """
-        context = self.get_context(user_id)
-        
         # Update user info
-        if 'user_info' not in context:
-            context['user_info'] = {}
-        
-        context['user_info'].update(kwargs)
+        self.get_context(user_id).user_info.update(kwargs)
+        self._dirty.add(user_id)
     
-    def extract_topics(self, user_id: str) -> List[str]:
+    def extract_topics(self, user_id: int) -> List[str]:
         """
         Extract likely conversation topics from recent history.
         
@@ -188,16 +466,122 @@ class ContextManager:
         """
         # This is a placeholder for future ML-based topic extraction
         # For now, just return the last 3 messages
-        context = self.get_context(user_id)
-        history = context.get('message_history', [])
+        history = self.get_context(user_id).message_history
         
         if not history:
             return []
         
         # Get last few user messages
         recent_messages = [
-            msg['content'] for msg in history[-5:] 
-            if msg['role'] == 'user'
+            msg.content for msg in islice(history, max(0, len(history) - 5), None)
+            if msg.role == 'user'
         ]
         
-        return recent_messages
\ No newline at end of file
+        return recent_messages
+    
+    def mark_dirty(self, user_id: int):
+        """
+        Flag a context as changed so the next flush persists it.
+        
+        Callers that modify a context directly should call this.
+        
+        Args:
+            user_id: The user's ID
+        """
+        self._dirty.add(user_id)
+    
+    async def flush(self) -> int:
+        """
+        Persist the contexts that changed since the last flush.
+        
+        Updates only touch the in-memory dictionaries; this is called
+        periodically so that many changes to the same user are coalesced
+        into a single write.
+        
+        Returns:
+            The number of contexts written
+        """
+        async with self._flush_lock:
+            if not self._dirty and not self._removed and not self._evicted:
+                return 0
+            
+            dirty, self._dirty = self._dirty, set()
+            removed, self._removed = self._removed, set()
+            batch, self._evicted = self._evicted, {}
+            batch.update(
+                (user_id, self.contexts[user_id])
+                for user_id in dirty
+                if user_id in self.contexts
+            )
+            
+            try:
+                await self._persist(batch, removed)
+            except Exception:
+                # Keep the changes queued so the next flush retries them
+                for user_id, context in batch.items():
+                    if user_id in self.contexts:
+                        self._dirty.add(user_id)
+                    else:
+                        self._evicted.setdefault(user_id, context)
+                self._removed.update(removed - self.contexts.keys())
+                raise
+            
+            return len(batch)
+    
+    async def _persist(self, batch: Dict[int, UserContext], removed: Set[int]):
+        """
+        Write changed contexts to the backing store.
+        
+        Contexts are serialized here on the event loop, so they can't change
+        while being written; the database writes run on a worker thread.
+        
+        Args:
+            batch: Changed contexts keyed by user ID
+            removed: IDs of contexts that were removed
+        """
+        if self._db is None:
+            return
+        
+        now = time.time()
+        rows = [
+            (user_id, context.to_record(), context.last_active if context.last_active is not None else now)
+            for user_id, context in batch.items()
+        ]
+        await asyncio.to_thread(self._write, rows, removed)
+    
+    def _write(self, rows: List[Tuple[int, bytes, float]], removed: Set[int]):
+        """
+        Apply a batch of changes to the backing store in a single transaction.
+        
+        Expired rows, including those of users no longer held in memory, are
+        deleted as part of the same transaction.
+        
+        Args:
+            rows: (user ID, serialized context, last active time) tuples
+            removed: IDs of contexts that were removed
+        """
+        cutoff = time.time() - self._expiry_seconds
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "DELETE FROM contexts WHERE user_id = ?",
+                ((user_id,) for user_id in removed)
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO contexts (user_id, data, last_active) VALUES (?, ?, ?)",
+                rows
+            )
+            self._db.execute("DELETE FROM contexts WHERE last_active < ?", (cutoff,))
+    
+    def close(self):
+        """
+        Close the backing store, if any.
+        
+        Call flush first; changes that haven't been flushed are lost.
+        """
+        if self._db_reader is not None:
+            self._db_reader.close()
+            self._db_reader = None
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
@@ -0,0 +1,52 @@
+"""
+Shared HTTP client for TradeMaster 2.0
+Provides the single aiohttp session used for all outbound API requests.
+"""
+
+import logging
+from typing import Optional
+
+import aiohttp
+
+from utils.serialization import dumps
+
+logger = logging.getLogger("TradeMaster.HTTP")
+
+# One pool for every module that talks to an external API, so connections to
+# the same host are kept alive and reused instead of being opened per caller
+_session: Optional[aiohttp.ClientSession] = None
+
+def get_shared_session() -> aiohttp.ClientSession:
+    """
+    Get the shared HTTP session, creating it on first use.
+
+    The session is created lazily because modules using it are constructed
+    before the event loop runs. A closed session is replaced transparently.
+    Requests that need a different timeout than the 15 second default should
+    pass their own.
+
+    Returns:
+        The shared HTTP session
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=64,
+                limit_per_host=32,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True
+            ),
+            timeout=aiohttp.ClientTimeout(total=15),
+            json_serialize=dumps
+        )
+        logger.debug("Shared HTTP session created")
+    return _session
+
+async def close_shared_session() -> None:
+    """Close the shared HTTP session if one was created."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -6,59 +6,31 @@ trading, markets, and financial concepts, with the ability to use specialized to
 for real-time market data.
 """
 
+import asyncio
+import functools
+import hashlib
 import logging
 import os
-import json
 import re
 import aiohttp
-import random
-from typing import Optional, Dict, Any, List, Tuple
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from itertools import cycle, islice
+from typing import (Optional, ClassVar, Dict, Any, AsyncContextManager, AsyncIterator, Callable, Iterator,
+                    List, Sequence, Tuple)
 
 # Import tool registry and loader
 from tools import registry, load_tools
+from core.context import UserContext
+from core.http import close_shared_session, get_shared_session
+from utils.cache import TTLCache
+from utils.serialization import dumpb, dumps, loads
 
 logger = logging.getLogger("TradeMaster.LLM")
 
-class LLMEngine:
-    """LLM engine for TradeMaster.
-    
-    This implementation integrates with Groq LLM API to generate
-    responses to user queries. It maintains conversation history and provides a consistent
-    trading assistant persona through a well-defined system prompt.
-    
-    Features:
-    1. Integration with Groq LLM API
-    2. Conversation history management
-    3. Trading assistant persona with market knowledge
-    4. Tool integration for real-time market data
-    5. Fallback mechanisms for API failures
-    """
-    
-    def __init__(self):
-        # Initialize API configurations
-        self.groq_api_key = os.getenv("GROQ_API_KEY")  # API key for Groq LLM service
-        self.groq_model = os.getenv("GROQ_MODEL", "llama3-70b-8192")  # Default model for Groq
-        
-        # Define system prompt for trading assistant persona
-        self.system_prompt = self._get_system_prompt()
-        
-        # Initialize fallback responses for when API calls fail
-        self._init_fallback_responses()
-        
-        # Load tools
-        self.tool_names = load_tools()
-        
-        # Log initialization with available APIs
-        self._log_initialization()
-    
-    def _get_system_prompt(self) -> str:
-        """Define the system prompt that establishes the assistant's persona.
-        
-        Returns:
-            A comprehensive system prompt string that defines the assistant's identity,
-            knowledge areas, and interaction style.
-        """
-        return """
+# The assistant persona sent as the system message of every request; built
+# once at import rather than for each engine
+_SYSTEM_PROMPT = """
         You are TradeMaster, an expert trading assistant with deep knowledge of financial markets, 
         trading strategies, and investment concepts. Your purpose is to provide accurate, 
         educational, and actionable insights to traders of all experience levels.
@@ -93,30 +65,343 @@ class LLMEngine:
         ALWAYS use the appropriate tool to fetch this information instead of relying on your
         training data which may be outdated.
         """.strip()
+
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+
+# Completions can take longer than the market data APIs the shared session's
+# default timeout is tuned for
+GROQ_TIMEOUT = aiohttp.ClientTimeout(total=30)
+
+# Market data tools whose failures are retried as a web search
+_WEB_SEARCH_FALLBACK_TOOLS = frozenset({"price_checker", "market_trends"})
+
+# Web search queries used in place of a failed tool, by the price checker's
+# market type and the market trends category; unknown values get the stock
+# and trending queries respectively
+_PRICE_QUERIES = {
+    "auto": "What is the current price of {symbol} cryptocurrency or stock",
+    "crypto": "What is the current price of {symbol} cryptocurrency",
+    "stock": "What is the current price of {symbol} stock"
+}
+
+_TREND_QUERIES = {
+    "gainers": "What are the top {limit} gaining {market_type}s today",
+    "losers": "What are the top {limit} losing {market_type}s today",
+    "trending": "What are the trending {market_type}s today"
+}
+
+# How deeply tool calls may nest: a tool, and the fallback it calls
+MAX_TOOL_DEPTH = 2
+_tool_depth: ContextVar[int] = ContextVar("tool_depth", default=0)
+
+# Most estimated tokens of previous messages sent along with a new one; older
+# ones add prompt tokens without helping much with the answer. How many
+# messages are kept at all is up to the context manager's max_history
+MAX_HISTORY_TOKENS = 4096
+
+# Canned replies used only when the Groq API is unavailable
+_FALLBACK_RESPONSES = (
+    "I'm having trouble connecting to my knowledge base right now. As a trading assistant, I can tell you that successful trading typically involves a combination of technical analysis, fundamental research, and disciplined risk management. Could you try your question again in a moment?",
+    "It seems I'm experiencing a temporary issue accessing my full capabilities. In general, when analyzing markets, it's important to consider multiple timeframes and confirm signals across different indicators. I should be back to normal shortly.",
+    "I apologize for the inconvenience, but I'm currently unable to process your request fully. Remember that proper position sizing and risk management are foundational to any successful trading strategy. Please try again soon.",
+)
+
+# Fixed replies to messages that need no answer from the model: ones that
+# are empty once user mentions are removed, greetings and acknowledgements
+_MENTION_RE = re.compile(r"<@!?\d+>")
+_EMPTY_REPLY = "Could you share your question?"
+_GREETINGS = frozenset({"hi", "hey", "hello", "yo"})
+_GREETING_REPLY = "Hi! Ask me about prices, market trends or any trading topic."
+_ACKNOWLEDGEMENTS = frozenset({"ok", "k", "thx", "ty", "thanks", "thank you"})
+_ACKNOWLEDGEMENT_REPLY = "You're welcome! Let me know if you have another question."
+
+# Patterns recognizing price and market trend questions in a lowercased
+# message. Each captures one value: the symbol, or the market type
+_PRICE_PATTERNS = (
+    r"(?:what'?s|what is|tell me|show|get) (?:the )?(?:current |latest |present |real-time |live )?(?:price|value|worth|rate) (?:of |for )?([a-zA-Z0-9]+)",
+    r"how much (?:is|does) ([a-zA-Z0-9]+) (?:cost|worth|trading for|trading at|going for)",
+    r"([a-zA-Z0-9]+) price",
+    r"price (?:of|for) ([a-zA-Z0-9]+)",
+    r"([a-zA-Z0-9]+) (?:is trading at|costs|is worth)",
+    r"(?:check|lookup|find|get) ([a-zA-Z0-9]+) (?:price|value|rate)",
+    r"(?:what is|what's) ([a-zA-Z0-9]+) (?:doing|at|trading at)",
+)
+
+_TREND_PATTERNS = (
+    # Original patterns with market type specified
+    r"(?:what'?s|what is|tell me|show|get) (?:the )?(?:top|best|leading|biggest) (?:gainers|performers|movers) (?:in|on) (?:the )?(crypto|stock|cryptocurrency|stocks)",
+    r"(?:what'?s|what is|tell me|show|get) (?:the )?(?:top|worst|biggest) (?:losers|declining|falling) (?:in|on) (?:the )?(crypto|stock|cryptocurrency|stocks)",
+    r"(?:what'?s|what is|tell me|show|get) (?:the )?(?:trending|hot|popular) (?:in|on) (?:the )?(crypto|stock|cryptocurrency|stocks)",
+
+    # Additional patterns without explicit market type
+    r"(?:what are|what're|which are|list|show me) (?:the )?(?:top|best|leading|biggest) (?:gainers|performers|movers)(?: today| right now| currently)?(?: in| on)? (?:the )?(crypto|stock|cryptocurrency|stocks)?",
+    r"(?:what are|what're|which are|list|show me) (?:the )?(?:top|worst|biggest) (?:losers|declining|falling)(?: today| right now| currently)?(?: in| on)? (?:the )?(crypto|stock|cryptocurrency|stocks)?",
+    r"(?:what are|what're|which are|list|show me) (?:the )?(?:trending|hot|popular)(?: today| right now| currently)?(?: in| on)? (?:the )?(crypto|stock|cryptocurrency|stocks)?",
+)
+
+# The market trends tool's name for each market type the trend patterns capture
+_MARKET_NORM = {
+    "crypto": "crypto",
+    "cryptocurrency": "crypto",
+    "stock": "stock",
+    "stocks": "stock"
+}
+
+# Every pattern above needs at least one of these words, so messages without
+# any of them skip the regex scans entirely
+_TOOL_HINTS = (
+    "price", "value", "worth", "rate", "cost", "trading", "how much", "what",
+    "gainers", "performers", "movers", "losers", "declining", "falling",
+    "trending", "hot", "popular"
+)
+
+def _combine_patterns(patterns: Tuple[str, ...]) -> "re.Pattern[str]":
+    """Join patterns into one alternation, each wrapped in a named group.
     
-    def _init_fallback_responses(self):
-        """Initialize fallback responses for when API calls fail.
+    Args:
+        patterns: The patterns to join
         
-        These responses are used only when external LLM API calls fail, to ensure
-        the system can still provide some value to users.
-        """
-        self.fallback_responses = [
-            "I'm having trouble connecting to my knowledge base right now. As a trading assistant, I can tell you that successful trading typically involves a combination of technical analysis, fundamental research, and disciplined risk management. Could you try your question again in a moment?",
-            "It seems I'm experiencing a temporary issue accessing my full capabilities. In general, when analyzing markets, it's important to consider multiple timeframes and confirm signals across different indicators. I should be back to normal shortly.",
-            "I apologize for the inconvenience, but I'm currently unable to process your request fully. Remember that proper position sizing and risk management are foundational to any successful trading strategy. Please try again soon."
-        ]
+    Returns:
+        The compiled alternation, which finds a match for any of the patterns
+        in a single scan of the message
+    """
+    return re.compile("|".join(f"(?P<p{i}>{pattern})" for i, pattern in enumerate(patterns)))
+
+def _captured(match: "re.Match[str]") -> Optional[str]:
+    """Get the value captured by the alternative of a combined pattern that matched.
+    
+    Args:
+        match: A match of a pattern built by _combine_patterns
+        
+    Returns:
+        The alternative's captured value, or None if it didn't participate
+    """
+    # The alternative's own group directly follows its named wrapper group
+    return match.group(match.re.groupindex[match.lastgroup] + 1)
+
+_PRICE_RE = _combine_patterns(_PRICE_PATTERNS)
+_TREND_RE = _combine_patterns(_TREND_PATTERNS)
+
+# Trend categories by the words that signal them, matched in one scan of the
+# message; gainers take priority over losers when both appear. The lookahead
+# lets matches overlap, so one keyword never hides another
+_CATEGORY_RE = re.compile(r"(?=(?P<gainers>gainers|performers)|(?P<losers>losers|declining|falling))")
+
+def _detect_trend_category(message_lower: str) -> str:
+    """Determine which trend category a lowercased message asks about.
+    
+    Args:
+        message_lower: The user's message, lowercased
+        
+    Returns:
+        "gainers", "losers" or "trending"
+    """
+    category = "trending"
+    for match in _CATEGORY_RE.finditer(message_lower):
+        if match.lastgroup == "gainers":
+            return "gainers"
+        category = "losers"
+    return category
+
+@functools.lru_cache(maxsize=4096)
+def _classify_intent(message_norm: str) -> Optional[Tuple[str, Tuple[Tuple[str, Any], ...]]]:
+    """Determine which tool, if any, a normalized message asks for.
+    
+    The result depends only on the message, so it is cached and repeated
+    questions from any user skip the pattern scans. It is returned as nested
+    tuples so cached results can't be modified by callers.
+    
+    Args:
+        message_norm: The user's message, lowercased with whitespace collapsed
+        
+    Returns:
+        A (tool_name, params) tuple with params as (name, value) pairs, or
+        None if no tool applies
+    """
+    # Most messages are conversation and contain none of the words the
+    # patterns look for
+    if not any(hint in message_norm for hint in _TOOL_HINTS):
+        return None
+    
+    # Check for price inquiries
+    match = _PRICE_RE.search(message_norm)
+    if match:
+        return "price_checker", (("symbol", _captured(match).upper()),)
+    
+    # Check for market trend inquiries
+    match = _TREND_RE.search(message_norm)
+    if match:
+        # Normalize market type, defaulting to crypto if not specified
+        market_type = _MARKET_NORM.get(_captured(match), "crypto")
+        
+        # Determine category based on message
+        category = _detect_trend_category(message_norm)
+        
+        return "market_trends", (("market_type", market_type), ("category", category), ("limit", 5))
+    
+    return None
+
+def _estimate_tokens(text: str) -> int:
+    """Roughly estimate how many tokens a chat message takes up.
+    
+    Args:
+        text: The message content
+        
+    Returns:
+        About one token per four characters, plus the message's overhead
+    """
+    return len(text) // 4 + 4
+
+def _trim_history(conversation_history: Sequence[Dict[str, str]], message: str) -> Iterator[Dict[str, str]]:
+    """Select the part of a conversation history to send with a message.
+    
+    The context manager records the user's message before a response is
+    generated, so a trailing copy of it is dropped; it is sent separately
+    as the final turn. Of the rest, the most recent messages are kept, as
+    many as fit in an estimated MAX_HISTORY_TOKENS tokens. The number of
+    messages is already capped by the context manager's max_history.
+    
+    Args:
+        conversation_history: The conversation's messages, oldest first
+        message: The user's current message
+        
+    Returns:
+        An iterator over the messages to send, oldest first
+    """
+    end = len(conversation_history)
+    if end:
+        last = conversation_history[-1]
+        if last.get("role") == "user" and last.get("content") == message:
+            end -= 1
+    
+    # Walk back from the newest message until the budget is used up
+    budget = MAX_HISTORY_TOKENS
+    start = end
+    while start:
+        tokens = _estimate_tokens(conversation_history[start - 1].get("content", ""))
+        if tokens > budget:
+            break
+        budget -= tokens
+        start -= 1
+    
+    # The kept messages are yielded without copying the history; the stored
+    # dicts are already in the API's format and are sent as they are
+    if start:
+        logger.debug("Trimmed %d old messages from the conversation history", start)
+    return islice(conversation_history, start, end)
+
+def _canned_reply(message: str) -> Optional[str]:
+    """Get a fixed reply for a message with nothing for the model to answer.
+    
+    Args:
+        message: The user's message text
+        
+    Returns:
+        The reply for an empty message (such as a bare mention of the bot), a
+        greeting or an acknowledgement, or None if the message needs the model
+    """
+    text = _MENTION_RE.sub("", message).strip().rstrip("!.").lower()
+    if not text:
+        return _EMPTY_REPLY
+    if text in _GREETINGS:
+        return _GREETING_REPLY
+    if text in _ACKNOWLEDGEMENTS:
+        return _ACKNOWLEDGEMENT_REPLY
+    return None
+
+@asynccontextmanager
+async def _no_slot() -> AsyncIterator[None]:
+    """Stand-in slot for callers that don't limit Groq API concurrency."""
+    yield
+
+def _response_cache_key(messages: List[Dict[str, str]]) -> bytes:
+    """Compute the response cache key for a prompt.
+    
+    The key covers every message, system prompt included. The final user
+    message is compared ignoring case, extra whitespace and trailing
+    punctuation, so "What is RSI?" and "what is rsi" share an answer.
+    
+    Args:
+        messages: The chat messages to send, ending with the user's message
+        
+    Returns:
+        A 16-byte digest of the prompt
+    """
+    question = " ".join(messages[-1]["content"].lower().split()).rstrip("?!. ")
+    return hashlib.blake2b(dumpb([messages[:-1], question]), digest_size=16).digest()
+
+class LLMEngine:
+    """LLM engine for TradeMaster.
+    
+    This implementation integrates with Groq LLM API to generate
+    responses to user queries. It maintains conversation history and provides a consistent
+    trading assistant persona through a well-defined system prompt.
+    
+    Features:
+    1. Integration with Groq LLM API
+    2. Conversation history management
+    3. Trading assistant persona with market knowledge
+    4. Tool integration for real-time market data
+    5. Fallback mechanisms for API failures
+    """
+    
+    # System prompt that establishes the assistant's persona
+    SYSTEM_PROMPT: ClassVar[str] = _SYSTEM_PROMPT
+    
+    # Responses used only when external LLM API calls fail, so the bot can
+    # still provide some value to users
+    FALLBACK_RESPONSES: ClassVar[Tuple[str, ...]] = _FALLBACK_RESPONSES
+    
+    def __init__(self):
+        # Initialize API configurations
+        self.groq_api_key = os.getenv("GROQ_API_KEY")  # API key for Groq LLM service
+        self.groq_model = os.getenv("GROQ_MODEL", "llama3-70b-8192")  # Default model for Groq
+        
+        # Parts of every Groq request that never change, built once
+        self._groq_headers = {
+            "Authorization": f"Bearer {self.groq_api_key}",
+            "Content-Type": "application/json"
+        }
+        self._system_message = {"role": "system", "content": self.SYSTEM_PROMPT}
+        
+        # Fallbacks are handed out in rotation, so consecutive failures don't
+        # repeat the same reply
+        self._fallbacks = cycle(self.FALLBACK_RESPONSES)
+        
+        # Load tools
+        self.tool_names = load_tools()
+        
+        # Tool calls currently running, keyed by tool name and parameters, so
+        # identical concurrent requests share a single call
+        self._tool_calls: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], asyncio.Task] = {}
+        
+        # Successful tool results, reused for repeated questions within a short
+        # window so the market data APIs aren't queried for every message
+        self._tool_cache = TTLCache(maxsize=1024, ttl=30.0)
+        
+        # Groq responses to prompts without tool data, keyed by a hash of the
+        # full message list, so a repeated question or a retry skips the API
+        self._response_cache = TTLCache(maxsize=1024, ttl=300.0)
+        
+        # Log initialization with available APIs
+        self._log_initialization()
     
     def _log_initialization(self):
         """Log the initialization status of the LLM Engine."""
         if self.groq_api_key:
-            logger.info(f"LLM Engine initialized with Groq API ({self.groq_model})")
+            logger.info("LLM Engine initialized with Groq API (%s)", self.groq_model)
         else:
             logger.warning("LLM Engine initialized without Groq API key. Will use fallback responses only.")
         
         if self.tool_names:
-            logger.info(f"Loaded tools: {', '.join(self.tool_names)}")
+            logger.info("Loaded tools: %s", ", ".join(self.tool_names))
     
-    async def _detect_tool_usage(self, message: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    async def close(self):
+        """Release the resources held by the engine's tools and the shared HTTP session."""
+        await registry.close()
+        await close_shared_session()
+    
+    def _detect_tool_usage(self, message: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
         """Determine if a tool should be used based on message content and which tool.
         
         Args:
@@ -127,73 +412,82 @@ class LLMEngine:
             - tool_name: The name of the tool to use
             - params: Parameters to pass to the tool
         """
-        # Check for price inquiries
-        price_patterns = [
-            r"(?:what'?s|what is|tell me|show|get) (?:the )?(?:current |latest |present |real-time |live )?(?:price|value|worth|rate) (?:of |for )?([a-zA-Z0-9]+)",
-            r"how much (?:is|does) ([a-zA-Z0-9]+) (?:cost|worth|trading for|trading at|going for)",
-            r"([a-zA-Z0-9]+) price",
-            r"price (?:of|for) ([a-zA-Z0-9]+)",
-            r"([a-zA-Z0-9]+) (?:is trading at|costs|is worth)",
-            r"(?:check|lookup|find|get) ([a-zA-Z0-9]+) (?:price|value|rate)",
-            r"(?:what is|what's) ([a-zA-Z0-9]+) (?:doing|at|trading at)"
-        ]
-        
-        for pattern in price_patterns:
-            match = re.search(pattern, message.lower())
-            if match:
-                symbol = match.group(1).upper()
-                return True, {
-                    "tool_name": "price_checker",
-                    "params": {
-                        "symbol": symbol
-                    }
-                }
-        
-        # Check for market trend inquiries
-        trend_patterns = [
-            # Original patterns with market type specified
-            r"(?:what'?s|what is|tell me|show|get) (?:the )?(?:top|best|leading|biggest) (?:gainers|performers|movers) (?:in|on) (?:the )?(crypto|stock|cryptocurrency|stocks)",
-            r"(?:what'?s|what is|tell me|show|get) (?:the )?(?:top|worst|biggest) (?:losers|declining|falling) (?:in|on) (?:the )?(crypto|stock|cryptocurrency|stocks)",
-            r"(?:what'?s|what is|tell me|show|get) (?:the )?(?:trending|hot|popular) (?:in|on) (?:the )?(crypto|stock|cryptocurrency|stocks)",
-            
-            # Additional patterns without explicit market type
-            r"(?:what are|what're|which are|list|show me) (?:the )?(?:top|best|leading|biggest) (?:gainers|performers|movers)(?: today| right now| currently)?(?: in| on)? (?:the )?(crypto|stock|cryptocurrency|stocks)?",
-            r"(?:what are|what're|which are|list|show me) (?:the )?(?:top|worst|biggest) (?:losers|declining|falling)(?: today| right now| currently)?(?: in| on)? (?:the )?(crypto|stock|cryptocurrency|stocks)?",
-            r"(?:what are|what're|which are|list|show me) (?:the )?(?:trending|hot|popular)(?: today| right now| currently)?(?: in| on)? (?:the )?(crypto|stock|cryptocurrency|stocks)?",
-        ]
-        
-        for pattern in trend_patterns:
-            match = re.search(pattern, message.lower())
-            if match:
-                # Handle case where market type might not be specified
-                market_type = match.group(1).lower() if match.group(1) else "crypto"  # Default to crypto if not specified
-                # Normalize market type
-                if market_type in ["cryptocurrency", "crypto"]:
-                    market_type = "crypto"
-                elif market_type in ["stocks", "stock"]:
-                    market_type = "stock"
-                
-                # Determine category based on message
-                category = "trending"
-                if "gainers" in message.lower() or "performers" in message.lower():
-                    category = "gainers"
-                elif "losers" in message.lower() or "declining" in message.lower() or "falling" in message.lower():
-                    category = "losers"
-                
-                return True, {
-                    "tool_name": "market_trends",
-                    "params": {
-                        "market_type": market_type,
-                        "category": category,
-                        "limit": 5
-                    }
-                }
+        # Collapse case and whitespace so equivalent phrasings share a cache entry
+        intent = _classify_intent(" ".join(message.lower().split()))
+        if intent is None:
+            return False, None
         
-        return False, None
+        tool_name, params = intent
+        return True, {"tool_name": tool_name, "params": dict(params)}
     
     async def _execute_tool(self, tool_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a tool with the provided parameters.
         
+        Concurrent calls with the same tool and parameters (several users asking
+        for the same price at once) are coalesced into a single execution whose
+        result is shared by all callers. Successful results are also cached for
+        a short time, which covers repeated web search fallbacks as well.
+        
+        Args:
+            tool_name: The name of the tool to execute
+            params: Parameters to pass to the tool
+            
+        Returns:
+            The tool's response
+        """
+        # A tool call made from within a tool (the web search fallback) runs
+        # one level deeper; refusing to go further stops a misconfigured
+        # fallback from recursing, or joining its own in-flight call
+        depth = _tool_depth.get()
+        if depth >= MAX_TOOL_DEPTH:
+            logger.error("Not executing tool '%s': tool calls nested too deeply", tool_name)
+            return {"error": "Maximum tool call depth exceeded"}
+        
+        key = (tool_name, tuple(sorted(params.items())))
+        
+        cached = self._tool_cache.get(key)
+        if cached is not None:
+            logger.debug("Using cached result for tool '%s'", tool_name)
+            return cached
+        
+        task = self._tool_calls.get(key)
+        
+        if task is None:
+            # The task copies the current context, so tool calls it makes see
+            # the increased depth
+            token = _tool_depth.set(depth + 1)
+            try:
+                task = asyncio.ensure_future(self._run_tool(tool_name, params))
+            finally:
+                _tool_depth.reset(token)
+            self._tool_calls[key] = task
+            task.add_done_callback(lambda done: self._tool_call_done(key, done))
+        else:
+            logger.debug("Joining in-flight call to tool '%s'", tool_name)
+        
+        # Shield the shared call so one caller being cancelled doesn't cancel
+        # it for the others
+        return await asyncio.shield(task)
+    
+    def _tool_call_done(self, key: Tuple[str, Tuple[Tuple[str, Any], ...]], task: asyncio.Task):
+        """Forget a finished tool call and cache its result if it succeeded.
+        
+        Args:
+            key: The call's tool name and parameters
+            task: The finished call
+        """
+        self._tool_calls.pop(key, None)
+        
+        if task.cancelled() or task.exception() is not None:
+            return
+        
+        result = task.result()
+        if result and "error" not in result:
+            self._tool_cache.set(key, result)
+    
+    async def _run_tool(self, tool_name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Run a tool, falling back to web search if a market data tool fails.
+        
         Args:
             tool_name: The name of the tool to execute
             params: Parameters to pass to the tool
@@ -203,68 +497,43 @@ class LLMEngine:
         """
         tool = registry.get_tool(tool_name)
         if not tool:
-            logger.warning(f"Tool '{tool_name}' not found")
+            logger.warning("Tool '%s' not found", tool_name)
             return {"error": f"Tool '{tool_name}' not found"}
         
         try:
-            logger.info(f"Executing tool '{tool_name}' with params: {params}")
+            logger.info("Executing tool '%s' with params: %s", tool_name, params)
             result = await tool.execute(**params)
+            failure = "failed"
+        except Exception as e:
+            logger.error("Error executing tool '%s': %s", tool_name, e)
+            result = {"error": f"Error executing tool: {str(e)}"}
+            failure = "failed with an exception"
+        
+        # Check if this is a market data tool that failed
+        if tool_name in _WEB_SEARCH_FALLBACK_TOOLS and (not result or "error" in result):
+            # Log the failure and attempt web search fallback
+            logger.warning("%s %s, falling back to web search", tool_name, failure)
             
-            # Check if this is a market data tool that failed
-            if (tool_name in ["price_checker", "market_trends"] and 
-                ("error" in result or not result)):
-                # Log the failure and attempt web search fallback
-                logger.warning(f"{tool_name} failed, falling back to web search")
-                
-                # Construct an appropriate search query based on the original tool and params
-                search_query = self._construct_fallback_query(tool_name, params)
-                
-                # Use browser search as fallback
-                logger.info(f"Using browser search fallback with query: {search_query}")
-                browser_result = await self._execute_tool("browser_search", {
-                    "query": search_query,
-                    "search_type": "price" if tool_name == "price_checker" else "trends"
-                })
-                
-                if "error" not in browser_result:
-                    logger.info("Browser search fallback successful")
-                    # Add a note that this is fallback data
-                    browser_result["note"] = f"This data was obtained via web search fallback because the {tool_name} API failed"
-                    return browser_result
-                else:
-                    logger.warning(f"Browser search fallback also failed: {browser_result['error']}")
-                    # Return the original error result
-                    return result
+            # Construct an appropriate search query based on the original tool and params
+            search_query = self._construct_fallback_query(tool_name, params)
             
-            return result
-        except Exception as e:
-            logger.error(f"Error executing tool '{tool_name}': {str(e)}")
+            # Use browser search as fallback
+            logger.info("Using browser search fallback with query: %s", search_query)
+            browser_result = await self._execute_tool("browser_search", {
+                "query": search_query,
+                "search_type": "price" if tool_name == "price_checker" else "trends"
+            })
             
-            # If this is a market data tool that failed with an exception, try web search
-            if tool_name in ["price_checker", "market_trends"]:
-                # Log the failure and attempt web search fallback
-                logger.warning(f"{tool_name} failed with exception, falling back to web search")
-                
-                # Construct an appropriate search query based on the original tool and params
-                search_query = self._construct_fallback_query(tool_name, params)
-                
-                # Use browser search as fallback
-                logger.info(f"Using browser search fallback with query: {search_query}")
-                browser_result = await self._execute_tool("browser_search", {
-                    "query": search_query,
-                    "search_type": "price" if tool_name == "price_checker" else "trends"
-                })
-                
-                if "error" not in browser_result:
-                    logger.info("Browser search fallback successful")
-                    # Add a note that this is fallback data
-                    browser_result["note"] = f"This data was obtained via web search fallback because the {tool_name} API failed with an exception"
-                    return browser_result
-                else:
-                    logger.warning(f"Browser search fallback also failed: {browser_result['error']}")
-                    # Return the original error
+            if "error" not in browser_result:
+                logger.info("Browser search fallback successful")
+                # Add a note that this is fallback data, on a copy since the
+                # search result may be cached and shared with other callers
+                return {**browser_result, "note": f"This data was obtained via web search fallback because the {tool_name} API {failure}"}
             
-            return {"error": f"Error executing tool: {str(e)}"}
+            # Return the original error result
+            logger.warning("Browser search fallback also failed: %s", browser_result["error"])
+        
+        return result
     
     def _construct_fallback_query(self, tool_name: str, params: Dict[str, Any]) -> str:
         """Construct a web search query based on the original tool and parameters.
@@ -277,33 +546,44 @@ class LLMEngine:
             A formatted web search query
         """
         if tool_name == "price_checker":
-            symbol = params.get("symbol", "").upper()
-            market_type = params.get("market_type", "auto")
-            
-            if market_type == "auto":
-                # Include both possibilities in the query
-                return f"What is the current price of {symbol} cryptocurrency or stock"
-            elif market_type == "crypto":
-                return f"What is the current price of {symbol} cryptocurrency"
-            else:
-                return f"What is the current price of {symbol} stock"
-                
-        elif tool_name == "market_trends":
-            market_type = params.get("market_type", "crypto")
-            category = params.get("category", "trending")
-            limit = params.get("limit", 5)
-            
-            if category == "gainers":
-                return f"What are the top {limit} gaining {market_type}s today"
-            elif category == "losers":
-                return f"What are the top {limit} losing {market_type}s today"
-            else:
-                return f"What are the trending {market_type}s today"
+            # Include both possibilities in the query unless the market is known
+            template = _PRICE_QUERIES.get(params.get("market_type", "auto"), _PRICE_QUERIES["stock"])
+            return template.format(symbol=params.get("symbol", "").upper())
+        
+        if tool_name == "market_trends":
+            template = _TREND_QUERIES.get(params.get("category", "trending"), _TREND_QUERIES["trending"])
+            return template.format(market_type=params.get("market_type", "crypto"), limit=params.get("limit", 5))
         
         # Default generic query
         return f"Latest information about {' '.join(str(v) for v in params.values())}"
     
-    async def generate_response(self, message: str, user_id: str, context: Optional[Dict[str, Any]] = None) -> str:
+    async def fetch_tool_data(self, message: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Detect whether a message needs a tool and run it if so.
+        
+        This doesn't depend on conversation history, so callers can start it
+        as soon as a message arrives and pass the result to generate_response.
+        
+        Args:
+            message: The user's message text
+            
+        Returns:
+            Tuple of (tool_params, tool_result), both None if no tool is needed
+        """
+        # Check if we should use a tool
+        should_use_tool, tool_params = self._detect_tool_usage(message)
+        
+        # If we should use a tool, execute it
+        tool_result = None
+        if should_use_tool and tool_params:
+            tool_result = await self._execute_tool(tool_params["tool_name"], tool_params["params"])
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Tool result: %.200s...", dumps(tool_result))
+        
+        return tool_params, tool_result
+    
+    async def generate_response(self, message: str, user_id: int, context: Optional[UserContext] = None,
+                                tool_data: Optional[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = None,
+                                slot: Optional[Callable[[], AsyncContextManager[None]]] = None) -> str:
         """Generate a response to a user message using Groq LLM API.
         
         This is the main entry point for processing user queries. It attempts to use
@@ -313,116 +593,228 @@ class LLMEngine:
             message: The user's message text
             user_id: The user's ID for conversation history management
             context: Optional context information containing conversation history
+            tool_data: Result of fetch_tool_data for this message, if already fetched
+            slot: Factory for a context manager held around the Groq API call,
+                such as a concurrency limiter's slot
             
         Returns:
             A formatted response string addressing the user's query
         """
+        parts = []
+        try:
+            async for part in self.stream_response(message, user_id, context, tool_data, slot):
+                parts.append(part)
+        except Exception as e:
+            logger.error("Groq API call failed partway through the response: %s", e)
+            # Use fallback response rather than a truncated one
+            return next(self._fallbacks)
+        return "".join(parts)
+    
+    async def stream_response(self, message: str, user_id: int, context: Optional[UserContext] = None,
+                              tool_data: Optional[Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]] = None,
+                              slot: Optional[Callable[[], AsyncContextManager[None]]] = None) -> AsyncIterator[str]:
+        """Generate a response to a user message, yielding it as it arrives.
+        
+        The streaming counterpart of generate_response, for callers that show
+        the response while it is being generated. Canned and fallback
+        responses are yielded in one piece. Callers should consume the
+        iterator to the end so the API connection is released.
+        
+        The slot is only held around the Groq API call, so a failed call
+        raises inside it before the fallback response is used; a concurrency
+        limiter sees the failure instead of a quick successful call.
+        
+        Args:
+            message: The user's message text
+            user_id: The user's ID for conversation history management
+            context: Optional context information containing conversation history
+            tool_data: Result of fetch_tool_data for this message, if already fetched
+            slot: Factory for a context manager held around the Groq API call,
+                such as a concurrency limiter's slot
+            
+        Yields:
+            The pieces of the response text, in order
+        
+        Raises:
+            Exception: If the API call fails after part of the response was yielded
+        """
+        # Answer messages with nothing to ask without involving the model
+        reply = _canned_reply(message)
+        if reply is not None:
+            logger.debug("Using canned reply for user %s", user_id)
+            yield reply
+            return
+        
         # Log the incoming message
-        logger.info(f"Generating response for user {user_id}: {message[:50]}...")
+        logger.info("Generating response for user %s: %.50s...", user_id, message)
         
-        # Check if we should use a tool
-        should_use_tool, tool_params = await self._detect_tool_usage(message)
+        # Run any tool the message needs unless the caller already did
+        if tool_data is None:
+            tool_data = await self.fetch_tool_data(message)
+        tool_params, tool_result = tool_data
         
-        # If we should use a tool, execute it
-        tool_result = None
-        if should_use_tool and tool_params:
-            tool_result = await self._execute_tool(tool_params["tool_name"], tool_params["params"])
-            logger.info(f"Tool result: {json.dumps(tool_result)[:200]}...")
+        # Use fallback response if no API key is available
+        if not self.groq_api_key:
+            logger.warning("No Groq API key available, using fallback response")
+            yield next(self._fallbacks)
+            return
         
         # Get conversation history from context if available
-        conversation_history = []
-        if context and 'message_history' in context:
-            conversation_history = context.get('message_history', [])
+        conversation_history = context.llm_history if context is not None else ()
         
-        # Try Groq API if available
-        if self.groq_api_key:
-            try:
-                # If we have a tool result, include it in the prompt
-                tool_prompt = ""
-                if tool_result:
-                    # Format tool result for the LLM
-                    tool_name = tool_params["tool_name"]
-                    if "error" in tool_result:
-                        tool_prompt = f"""
-                        \nIMPORTANT: I tried to get real-time data using the {tool_name} tool, but encountered an error: {tool_result['error']}
-                        
-                        When responding to the user:
-                        1. DO NOT provide any specific price or market data numbers since I don't have current data
-                        2. Explain that you're unable to provide real-time data at the moment due to a technical issue
-                        3. Apologize for the inconvenience
-                        4. Suggest that they check a reliable financial website or exchange for current data
-                        5. DO NOT make up or estimate current prices based on your training data\n
-                        """
-                    else:
-                        tool_prompt = f"\nHere is the real-time data from the {tool_name} tool:\n{json.dumps(tool_result, indent=2)}\n"
-                        tool_prompt += "\nPlease use this real-time data in your response.\n"
-                
-                # Generate response
-                response = await self._call_groq_api(message, conversation_history, tool_prompt)
-                logger.info("Generated response using Groq API")
-                return response
-            except Exception as e:
-                logger.error(f"Groq API call failed: {str(e)}")
-                # Use fallback response if API call fails
-                logger.warning("API call failed, using fallback response")
-                return random.choice(self.fallback_responses)
-    
-    async def _call_groq_api(self, message: str, conversation_history: List[Dict[str, str]], tool_prompt: str = "") -> str:
-        """Call the Groq LLM API to generate a response.
+        # If we have a tool result, include it in the prompt
+        tool_prompt = self._format_tool_prompt(tool_params, tool_result)
+        
+        started = False
+        try:
+            async with (slot or _no_slot)():
+                async for part in self._stream_groq_api(message, conversation_history, tool_prompt):
+                    started = True
+                    yield part
+        except Exception as e:
+            # Once part of the response is out it can't be replaced
+            if started:
+                raise
+            logger.error("Groq API call failed: %s", e)
+            # Use fallback response if API call fails
+            logger.warning("API call failed, using fallback response")
+            yield next(self._fallbacks)
+            return
+        
+        logger.info("Generated response using Groq API")
+    
+    @staticmethod
+    def _format_tool_prompt(tool_params: Optional[Dict[str, Any]], tool_result: Optional[Dict[str, Any]]) -> str:
+        """Format a tool's result as instructions for the LLM.
+        
+        Args:
+            tool_params: The tool name and parameters from fetch_tool_data
+            tool_result: The tool's response from fetch_tool_data
+            
+        Returns:
+            The tool prompt, or an empty string if no tool was used
+        """
+        if not tool_result:
+            return ""
+        
+        # Format tool result for the LLM
+        tool_name = tool_params["tool_name"]
+        if "error" in tool_result:
+            return f"""
+            \nIMPORTANT: I tried to get real-time data using the {tool_name} tool, but encountered an error: {tool_result['error']}
+            
+            When responding to the user:
+            1. DO NOT provide any specific price or market data numbers since I don't have current data
+            2. Explain that you're unable to provide real-time data at the moment due to a technical issue
+            3. Apologize for the inconvenience
+            4. Suggest that they check a reliable financial website or exchange for current data
+            5. DO NOT make up or estimate current prices based on your training data\n
+            """
+        
+        return (f"\nHere is the real-time data from the {tool_name} tool:\n{dumps(tool_result)}\n"
+                "\nPlease use this real-time data in your response.\n")
+    
+    async def _stream_groq_api(self, message: str, conversation_history: Sequence[Dict[str, str]], tool_prompt: str = "") -> AsyncIterator[str]:
+        """Call the Groq LLM API to generate a response, yielding it as it arrives.
         
         Args:
             message: The user's message
             conversation_history: List of previous messages in the conversation
-            tool_prompt: Additional prompt with tool data
+            tool_prompt: Additional prompt with tool data, sent as its own system
+                message just before the user's message
             
-        Returns:
-            The generated response text
+        Yields:
+            The pieces of the response text, in order; a cached response is
+            yielded whole
         
         Raises:
-            Exception: If the API call fails
+            Exception: If the API call fails or produces no text
         """
-        url = "https://api.groq.com/openai/v1/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.groq_api_key}",
-            "Content-Type": "application/json"
-        }
+        # Prepare messages array with system prompt and conversation history.
+        # The system prompt is sent unchanged on every request so the shared
+        # prefix can be reused by the API's prompt cache
+        messages = [self._system_message, *_trim_history(conversation_history, message)]
         
-        # Add tool information to system prompt if available
-        system_prompt = self.system_prompt
+        # Add tool information after the history, so only the end of the
+        # prompt changes with the live data
         if tool_prompt:
-            system_prompt = f"{system_prompt}\n{tool_prompt}"
-        
-        # Prepare messages array with system prompt and conversation history
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add conversation history - filter out unsupported fields like 'timestamp'
-        for msg in conversation_history:
-            if 'role' in msg and 'content' in msg:
-                messages.append({
-                    "role": msg['role'],
-                    "content": msg['content']
-                })
+            messages.append({"role": "system", "content": tool_prompt})
         
         # Add the current user message
         messages.append({"role": "user", "content": message})
         
+        # Answers without live data are reused for repeated questions in the
+        # same conversation
+        cache_key = None
+        if not tool_prompt:
+            cache_key = _response_cache_key(messages)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Using cached Groq response")
+                yield cached
+                return
+        
+        parts = []
+        async for delta in self._stream_groq_completion(messages):
+            parts.append(delta)
+            yield delta
+        
+        # A stream that ends without any text is a failed call, not an empty
+        # answer
+        if not parts:
+            raise Exception("Groq API returned an empty completion")
+        
+        if cache_key is not None:
+            self._response_cache.set(cache_key, "".join(parts))
+    
+    async def _stream_groq_completion(self, messages: List[Dict[str, str]]) -> AsyncIterator[str]:
+        """Request a streamed chat completion from the Groq API.
+        
+        The completion arrives as server-sent events, so its text can be
+        consumed as it is generated instead of after the whole response.
+        
+        Args:
+            messages: The chat messages to send
+            
+        Yields:
+            The pieces of the response text, in order
+        
+        Raises:
+            Exception: If the API call fails or the stream reports an error
+        """
         payload = {
             "model": self.groq_model,
             "messages": messages,
             "temperature": 0.7,
-            "max_tokens": 800  # Reduced to ensure we stay under Discord's 2000 char limit
+            "max_tokens": 800,  # Reduced to ensure we stay under Discord's 2000 char limit
+            "stream": True
         }
         
-        # Make the API call
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Groq API returned status {response.status}: {error_text}")
+        # Make the API call over the shared session, so the connection to Groq
+        # stays warm between messages
+        session = get_shared_session()
+        async with session.post(GROQ_API_URL, headers=self._groq_headers, json=payload, timeout=GROQ_TIMEOUT) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                raise Exception(f"Groq API returned status {response.status}: {error_text}")
+            
+            # Each event is a "data: <json chunk>" line; the stream ends with
+            # "data: [DONE]"
+            async for line in response.content:
+                if not line.startswith(b"data:"):
+                    continue
                 
-                data = await response.json()
-                return data["choices"][0]["message"]["content"]
-        # If no API key is available, use fallback response
-            # Use fallback response if no API key is available
-            logger.warning("No Groq API key available, using fallback response")
-            return random.choice(self.fallback_responses)
\ No newline at end of file
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                
+                event = loads(data)
+                error = event.get("error")
+                if error:
+                    raise Exception(f"Groq API stream error: {error}")
+                
+                choices = event.get("choices")
+                if choices:
+                    delta = choices[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
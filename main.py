@@ -5,9 +5,6 @@ Entry point for the bot application.
 """
 
 import sys
-import os
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
 import asyncio
 import logging
 import os
@@ -16,7 +13,7 @@ from dotenv import load_dotenv
 
 # Import bot client
 from bot.client import TradeMasterClient
-from utils.logging import setup_logging
+from utils.logging import setup_logging, stop_logging
 
 # Set up logging with more detailed configuration
 logger = setup_logging()
@@ -53,9 +50,16 @@ async def main():
     
     try:
         logger.info("Starting TradeMaster Discord bot...")
-        await client.start(TOKEN)
+        # The context manager closes the client on exit, letting in-flight
+        # responses finish and contexts flush
+        async with client:
+            await client.start(TOKEN)
     except Exception as e:
         logger.critical(f"Failed to start bot: {e}")
+    finally:
+        # Write out queued log records before the process exits
+        logger.info("TradeMaster Discord bot stopped")
+        stop_logging()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
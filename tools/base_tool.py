@@ -7,7 +7,11 @@ Tools extend the bot's capabilities by providing specialized functions.
 
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Optional, List
+from typing import Any, Dict, List
+
+import aiohttp
+
+from core.http import get_shared_session
 
 logger = logging.getLogger("TradeMaster.Tools")
 
@@ -25,6 +29,26 @@ class BaseTool(ABC):
     to provide up-to-date market information to users.
     """
     
+    def http_session(self) -> aiohttp.ClientSession:
+        """
+        Get the HTTP session for the tool's API requests.
+        
+        All tools use the shared session from core.http, so repeated calls to
+        the same API skip the TCP and TLS handshakes whichever tool makes them.
+        
+        Returns:
+            The shared HTTP session
+        """
+        return get_shared_session()
+    
+    async def close(self) -> None:
+        """
+        Release the tool's resources.
+        
+        The shared HTTP session is owned by core.http and is not closed here.
+        Tools holding other resources should override this.
+        """
+    
     @property
     @abstractmethod
     def name(self) -> str:
@@ -20,6 +20,29 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Emoji and pictograph ranges stripped from log messages; compiled once at import
+# rather than on every sanitized message
+_EMOJI_RE = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F700-\U0001F77F"  # alchemical symbols
+    "\U0001F780-\U0001F7FF"  # Geometric Shapes
+    "\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
+    "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
+    "\U0001FA00-\U0001FA6F"  # Chess Symbols
+    "\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
+    "\U00002702-\U000027B0"  # Dingbats
+    "\U000024C2-\U0001F251"
+    "\U00002500-\U00002BEF"  # Additional symbols
+    "\U00002300-\U000023FF"  # Miscellaneous Technical
+    "\U00002B00-\U00002BFF"  # Miscellaneous Symbols and Arrows
+    "\U0001F000-\U0001F02F"  # Mahjong Tiles
+    "\U0001F0A0-\U0001F0FF"  # Playing Cards
+    "\U0001F100-\U0001F1FF"  # Enclosed Alphanumeric Supplement
+    "]")
+
 # Sanitize log messages by removing emoji characters and handling Unicode issues
 def sanitize_log_message(message):
     if not isinstance(message, str):
@@ -30,27 +53,7 @@ def sanitize_log_message(message):
     
     try:
         message = message.encode('utf-8', errors='replace').decode('utf-8', errors='replace')
-        emoji_pattern = re.compile(
-            "["
-            "\U0001F600-\U0001F64F"  # emoticons
-            "\U0001F300-\U0001F5FF"  # symbols & pictographs
-            "\U0001F680-\U0001F6FF"  # transport & map symbols
-            "\U0001F700-\U0001F77F"  # alchemical symbols
-            "\U0001F780-\U0001F7FF"  # Geometric Shapes
-            "\U0001F800-\U0001F8FF"  # Supplemental Arrows-C
-            "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-            "\U0001FA00-\U0001FA6F"  # Chess Symbols
-            "\U0001FA70-\U0001FAFF"  # Symbols and Pictographs Extended-A
-            "\U00002702-\U000027B0"  # Dingbats
-            "\U000024C2-\U0001F251"
-            "\U00002500-\U00002BEF"  # Additional symbols
-            "\U00002300-\U000023FF"  # Miscellaneous Technical
-            "\U00002B00-\U00002BFF"  # Miscellaneous Symbols and Arrows
-            "\U0001F000-\U0001F02F"  # Mahjong Tiles
-            "\U0001F0A0-\U0001F0FF"  # Playing Cards
-            "\U0001F100-\U0001F1FF"  # Enclosed Alphanumeric Supplement
-            "]")
-        return emoji_pattern.sub(r'', message)
+        return _EMOJI_RE.sub(r'', message)
     except Exception:
         return "[Unicode encoding error]"
 
@@ -12,7 +12,7 @@ from datetime import datetime
 
 from .base_tool import BaseTool
 import aiohttp
-import json
+from utils.serialization import loads
 import os
 from typing import Tuple
 
@@ -111,56 +111,61 @@ class MarketTrendsTool(BaseTool):
         if not params:
             params = {}
         
-        # Create a sanitized version of the headers for logging (to avoid exposing API keys)
-        log_headers = {}
-        for key, value in headers.items():
-            if "api-key" in key.lower() or "apikey" in key.lower() or "key" in key.lower():
-                log_headers[key] = self.sanitize_api_key(value)
-            else:
-                log_headers[key] = value
+        # Request and response details are only formatted when debug logging is on
+        debug = logger.isEnabledFor(logging.DEBUG)
         
         try:
-            # Log the full request details at debug level
             logger.info(f"Making API request to: {url}")
-            logger.info(f"Headers: {log_headers}")
-            logger.info(f"Params: {params}")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params) as response:
-                    response_text = await response.text()
-                    
-                    logger.info(f"Response status: {response.status}")
-                    logger.info(f"Response headers: {dict(response.headers)}")
+            # Log the full request details at debug level
+            if debug:
+                # Create a sanitized version of the headers for logging (to avoid exposing API keys)
+                log_headers = {}
+                for key, value in headers.items():
+                    if "api-key" in key.lower() or "apikey" in key.lower() or "key" in key.lower():
+                        log_headers[key] = self.sanitize_api_key(value)
+                    else:
+                        log_headers[key] = value
+                
+                logger.debug(f"Headers: {log_headers}")
+                logger.debug(f"Params: {params}")
+            
+            async with self.http_session().get(url, headers=headers, params=params) as response:
+                body = await response.read()
+                
+                if debug:
+                    logger.debug(f"Response status: {response.status}")
+                    logger.debug(f"Response headers: {dict(response.headers)}")
                     
                     # Log a preview of the response body
-                    preview = response_text[:500] + "..." if len(response_text) > 500 else response_text
-                    logger.info(f"Response body preview: {preview}")
-                    
-                    if response.status != 200:
-                        logger.error(f"API request failed: {response.status} - {url}")
-                        
-                        # Try to get more details from the response
-                        error_message = f"Status {response.status}"
-                        try:
-                            error_data = json.loads(response_text)
-                            if isinstance(error_data, dict):
-                                # Look for common error fields
-                                for field in ['message', 'error', 'error_message', 'status', 'detail']:
-                                    if field in error_data:
-                                        error_message = f"{error_message}: {error_data[field]}"
-                                        break
-                        except:
-                            error_message = f"API request failed with status {response.status}: {response_text[:200]}"
-                        
-                        return False, {"error": error_message, "status": response.status}
+                    preview = body[:500].decode(errors="replace") + ("..." if len(body) > 500 else "")
+                    logger.debug(f"Response body preview: {preview}")
+                
+                if response.status != 200:
+                    logger.error(f"API request failed: {response.status} - {url}")
                     
+                    # Try to get more details from the response
+                    error_message = f"Status {response.status}"
                     try:
-                        data = json.loads(response_text)
-                        return True, data
-                    except Exception as e:
-                        logger.error(f"Error parsing JSON response: {e}")
-                        logger.error(f"Response text: {response_text[:500]}")
-                        return False, {"error": f"Error parsing response: {str(e)}"}
+                        error_data = loads(body)
+                        if isinstance(error_data, dict):
+                            # Look for common error fields
+                            for field in ['message', 'error', 'error_message', 'status', 'detail']:
+                                if field in error_data:
+                                    error_message = f"{error_message}: {error_data[field]}"
+                                    break
+                    except:
+                        error_message = f"API request failed with status {response.status}: {body[:200].decode(errors='replace')}"
+                    
+                    return False, {"error": error_message, "status": response.status}
+                
+                try:
+                    data = loads(body)
+                    return True, data
+                except Exception as e:
+                    logger.error(f"Error parsing JSON response: {e}")
+                    logger.error(f"Response text: {body[:500].decode(errors='replace')}")
+                    return False, {"error": f"Error parsing response: {str(e)}"}
         
         except aiohttp.ClientError as e:
             logger.error(f"API connection error: {e} - {url}")
@@ -10,12 +10,35 @@ import os
 from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import aiohttp
-import json
+
+from utils.serialization import loads
 
 from .base_tool import BaseTool
 
 logger = logging.getLogger("TradeMaster.Tools.PriceChecker")
 
+# Well-known symbols used to auto-detect the market type, and CoinGecko ids
+# for the common cryptocurrencies; shared by every tool instance
+_COMMON_STOCKS = frozenset({
+    "AAPL", "MSFT", "GOOGL", "AMZN", "META", "TSLA", "NVDA", "JPM",
+    "V", "JNJ", "WMT", "PG", "MA", "UNH", "HD", "BAC", "XOM", "DIS",
+    "PYPL", "INTC", "CMCSA", "NFLX", "CSCO", "ADBE", "CRM", "VZ"
+})
+
+_COMMON_CRYPTOS = frozenset({
+    "BTC", "ETH", "BNB", "XRP", "SOL", "ADA", "AVAX", "DOT", "DOGE",
+    "MATIC", "LINK", "UNI", "LTC", "BCH", "ATOM", "XLM", "ALGO", "NEAR"
+})
+
+_COINGECKO_IDS = {
+    "BTC": "bitcoin", "ETH": "ethereum", "BNB": "binancecoin",
+    "SOL": "solana", "XRP": "ripple", "ADA": "cardano",
+    "AVAX": "avalanche-2", "DOT": "polkadot", "DOGE": "dogecoin",
+    "MATIC": "matic-network", "LINK": "chainlink", "UNI": "uniswap",
+    "LTC": "litecoin", "BCH": "bitcoin-cash", "ATOM": "cosmos",
+    "XLM": "stellar", "ALGO": "algorand", "NEAR": "near"
+}
+
 class PriceCheckerTool(BaseTool):
     """Tool for checking current market prices of stocks and cryptocurrencies."""
     
@@ -64,25 +87,9 @@ class PriceCheckerTool(BaseTool):
         self.alphavantage_api_key = os.getenv("ALPHA_VANTAGE_API_KEY")
         
         # Market type detection data
-        self.common_stocks = {
-            "AAPL", "MSFT", "GOOGL", "AMZN", "META", "TSLA", "NVDA", "JPM",
-            "V", "JNJ", "WMT", "PG", "MA", "UNH", "HD", "BAC", "XOM", "DIS",
-            "PYPL", "INTC", "CMCSA", "NFLX", "CSCO", "ADBE", "CRM", "VZ"
-        }
-        
-        self.common_cryptos = {
-            "BTC", "ETH", "BNB", "XRP", "SOL", "ADA", "AVAX", "DOT", "DOGE",
-            "MATIC", "LINK", "UNI", "LTC", "BCH", "ATOM", "XLM", "ALGO", "NEAR"
-        }
-        
-        self.coingecko_ids = {
-            "BTC": "bitcoin", "ETH": "ethereum", "BNB": "binancecoin",
-            "SOL": "solana", "XRP": "ripple", "ADA": "cardano",
-            "AVAX": "avalanche-2", "DOT": "polkadot", "DOGE": "dogecoin",
-            "MATIC": "matic-network", "LINK": "chainlink", "UNI": "uniswap",
-            "LTC": "litecoin", "BCH": "bitcoin-cash", "ATOM": "cosmos",
-            "XLM": "stellar", "ALGO": "algorand", "NEAR": "near"
-        }
+        self.common_stocks = _COMMON_STOCKS
+        self.common_cryptos = _COMMON_CRYPTOS
+        self.coingecko_ids = _COINGECKO_IDS
         
         logger.info("PriceChecker tool initialized")
     
@@ -130,30 +137,29 @@ class PriceCheckerTool(BaseTool):
         try:
             logger.info(f"Making API request to: {url}")
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers, params=params) as response:
-                    response_text = await response.text()
-                    
-                    if response.status != 200:
-                        error_message = f"Status {response.status}"
-                        try:
-                            error_data = json.loads(response_text)
-                            if isinstance(error_data, dict):
-                                for field in ['message', 'error', 'error_message', 'status', 'detail']:
-                                    if field in error_data:
-                                        error_message = f"{error_message}: {error_data[field]}"
-                                        break
-                        except:
-                            error_message = f"API request failed with status {response.status}"
-                        
-                        return False, {"error": error_message, "status": response.status}
-                    
+            async with self.http_session().get(url, headers=headers, params=params) as response:
+                body = await response.read()
+                
+                if response.status != 200:
+                    error_message = f"Status {response.status}"
                     try:
-                        data = json.loads(response_text)
-                        return True, data
-                    except Exception as e:
-                        logger.error(f"Error parsing JSON response: {e}")
-                        return False, {"error": f"Error parsing response: {str(e)}"}
+                        error_data = loads(body)
+                        if isinstance(error_data, dict):
+                            for field in ['message', 'error', 'error_message', 'status', 'detail']:
+                                if field in error_data:
+                                    error_message = f"{error_message}: {error_data[field]}"
+                                    break
+                    except:
+                        error_message = f"API request failed with status {response.status}"
+                    
+                    return False, {"error": error_message, "status": response.status}
+                
+                try:
+                    data = loads(body)
+                    return True, data
+                except Exception as e:
+                    logger.error(f"Error parsing JSON response: {e}")
+                    return False, {"error": f"Error parsing response: {str(e)}"}
         
         except aiohttp.ClientError as e:
             logger.error(f"API connection error: {e} - {url}")
@@ -116,6 +116,14 @@ class ToolRegistry:
             for tool in self._tools.values()
         ]
     
+    async def close(self) -> None:
+        """Release the resources held by all registered tools."""
+        for tool in self._tools.values():
+            try:
+                await tool.close()
+            except Exception as e:
+                logger.error(f"Error closing tool {tool.name}: {e}")
+    
     def clear(self) -> None:
         """Remove all tools from the registry."""
         self._tools.clear()
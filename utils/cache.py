@@ -0,0 +1,74 @@
+"""
+Caching helpers for the TradeMaster 2.0 bot.
+Provides a bounded in-memory cache whose entries expire after a fixed time.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+class TTLCache:
+    """
+    Least-recently-used cache with a time-to-live for every entry.
+
+    Entries older than the TTL are treated as missing and dropped when they
+    are looked up; once the cache holds maxsize entries, the least recently
+    used one is evicted to make room for a new one.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries kept
+            ttl: Seconds an entry stays valid after it is stored
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Look up an entry.
+
+        Args:
+            key: The entry's key
+            default: Value returned if the entry is missing or expired
+
+        Returns:
+            The cached value, or the default
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Store an entry, evicting the least recently used one if the cache is full.
+
+        Args:
+            key: The entry's key
+            value: The value to cache
+        """
+        entries = self._entries
+        entries[key] = (time.monotonic() + self.ttl, value)
+        entries.move_to_end(key)
+
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
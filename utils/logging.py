@@ -1,14 +1,39 @@
 """
 Logging configuration for the TradeMaster 2.0 bot.
 Sets up console and file logging with appropriate formatting.
+
+Records are put on a queue by the loggers and written out by a listener
+thread, so logging calls on the event loop never block on console or file I/O.
 """
 
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+# Listener thread writing queued records to the console and log file
+_listener: Optional[QueueListener] = None
+
+def stop_logging():
+    """
+    Stop the listener thread, writing out any records still queued.
+    
+    Called on shutdown and again at interpreter exit; later calls do nothing.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+# Write out any queued records when the interpreter exits
+atexit.register(stop_logging)
 
 def setup_logging():
     """Configure the logging system for the TradeMaster bot."""
+    global _listener
+    
     # Ensure the logs directory exists
     log_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs")
     os.makedirs(log_dir, exist_ok=True)
@@ -52,9 +77,15 @@ def setup_logging():
     for handler in root_logger.handlers[:]:
         root_logger.removeHandler(handler)
     
-    # Add our handlers
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
+    # Stop the listener from a previous call before replacing it
+    stop_logging()
+    
+    # Loggers only enqueue records; the listener thread does the actual writes
+    # and applies each handler's own level
+    log_queue = queue.Queue(-1)
+    root_logger.addHandler(QueueHandler(log_queue))
+    _listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
     
     # Set specific logger levels
     logging.getLogger('discord').setLevel(logging.WARNING)
@@ -0,0 +1,61 @@
+"""
+JSON serialization helpers for the TradeMaster 2.0 bot.
+Uses orjson when it is installed and falls back to the standard library.
+"""
+
+import json
+import logging
+from typing import Any, Union
+
+logger = logging.getLogger("TradeMaster.Serialization")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.debug("orjson not available, using the standard json module")
+
+def dumps(obj: Any) -> str:
+    """
+    Serialize an object to a compact JSON string.
+
+    Args:
+        obj: The object to serialize
+
+    Returns:
+        The JSON string
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, separators=(",", ":"))
+
+def dumpb(obj: Any) -> bytes:
+    """
+    Serialize an object to compact UTF-8 encoded JSON.
+
+    Use this where bytes are accepted (database blobs, request bodies) to
+    skip decoding the output.
+
+    Args:
+        obj: The object to serialize
+
+    Returns:
+        The JSON bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode()
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    Deserialize a JSON document.
+
+    Args:
+        data: The JSON string or bytes
+
+    Returns:
+        The deserialized object
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)